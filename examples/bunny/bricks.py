@@ -0,0 +1,75 @@
+# Copyright © 2019-2023 HK-SHAO
+# GPL-3.0 Licensed: https://github.com/HK-SHAO/RayTracingPBR
+
+import taichi as ti
+from taichi.math import *
+
+
+@ti.data_oriented
+class Bricks:
+    '''narrow-band bricks of an expensive sdf over the [-1, 1] cube, call bake() once after ti.init'''
+    def __init__(self, sdf, count: int = 32, cells: int = 7):
+        self.sdf   = sdf
+        self.count = count                      # bricks per edge of the cube
+        self.cells = cells                      # cells per edge of a brick, 8 samples keep blocks a power of two
+        self.cell  = 2.0 / (count * cells)
+        self.edge  = self.cell * cells
+        self.shell = self.cell                  # the sdf is only evaluated this close to the surface
+
+        self.center = ti.field(float, (count,) * 3)     # distance at the center of each brick
+        self.error  = ti.field(float, (count,) * 3)     # estimated interpolation error inside each brick
+        self.values = ti.field(float)
+        self.block  = ti.root.pointer(ti.ijk, count)    # only bricks near the surface are allocated
+        self.block.dense(ti.ijk, cells + 1).place(self.values)
+
+    @ti.func
+    def lerp(self, I: ivec3, p: vec3) -> float:
+        g = (p + 1.0) / self.cell - I * self.cells
+        c = ti.cast(clamp(floor(g), 0, self.cells - 1), int)
+        f = g - c
+        d = 0.0
+        for K in ti.static(ti.grouped(ti.ndrange(2, 2, 2))):
+            w  = mix(1.0 - f, f, K)
+            d += w.x * w.y * w.z * self.values[I * (self.cells + 1) + c + K]
+        return d
+
+    @ti.kernel
+    def bake(self):
+        radius = 0.5 * 3 ** 0.5 * self.edge
+        for I in ti.grouped(self.center):
+            d = self.sdf((I + 0.5) * self.edge - 1.0)
+            self.center[I] = d
+            if abs(d) < radius + self.shell:
+                for J in ti.grouped(ti.ndrange(self.cells + 1, self.cells + 1, self.cells + 1)):
+                    p = (I * self.cells + J) * self.cell - 1.0
+                    self.values[I * (self.cells + 1) + J] = self.sdf(p)
+
+        # a heuristic, not a bound: trilinear error tends to peak at the cell
+        # centers, so keep twice the worst one sampled there
+        for I in ti.grouped(self.center):
+            if ti.is_active(self.block, I):
+                e = 0.0
+                for J in ti.grouped(ti.ndrange(self.cells, self.cells, self.cells)):
+                    p = (I * self.cells + J + 0.5) * self.cell - 1.0
+                    e = max(e, abs(self.lerp(I, p) - self.sdf(p)))
+                self.error[I] = 2.0 * e
+
+    @ti.func
+    def distance(self, p: vec3) -> float:
+        sd = 0.0
+        I  = ti.cast(min(floor((p + 1.0) / self.edge), self.count - 1), int)
+        if length(p) > 1.0:
+            sd = self.sdf(p) # already cheap out there
+        elif not ti.is_active(self.block, I):
+            # far from the surface, a lower bound from the brick center is enough
+            d  = self.center[I]
+            sd = sign(d) * (abs(d) - length(p - (I + 0.5) * self.edge + 1.0))
+        else:
+            d = self.lerp(I, p)
+            if abs(d) < self.shell + self.error[I]:
+                sd = self.sdf(p)
+            else:
+                # at least one shell away once the error is taken off, so
+                # an interpolated value is never close enough to be a hit
+                sd = sign(d) * (abs(d) - self.error[I])
+        return sd
@@ -4,6 +4,8 @@
 import taichi as ti
 from taichi.math import *
 
+from bricks import Bricks
+
 ti.init(arch=ti.gpu, default_ip=ti.i32, default_fp=ti.f32)
 
 image_resolution = (3840, 2160)
@@ -27,6 +29,10 @@ MAX_RAYTRACE = 128
 SHAPE_NONE     = 0
 SHAPE_BUNNY    = 1
 
+BRICK_CACHE  = False # bake the network into narrow-band bricks
+BRICK_COUNT  = 32   # bricks per edge of the [-1, 1] cube
+BRICK_CELLS  = 7    # cells per edge of a brick, 8 samples keep blocks a power of two
+
 ENV_IOR = 1.000277
 
 aspect_ratio    = image_resolution[0] / image_resolution[1]
@@ -202,6 +208,8 @@ def sd_bunny(p: vec3) -> float:
 
     return sd
 
+bunny_bricks = Bricks(sd_bunny, BRICK_COUNT, BRICK_CELLS) if BRICK_CACHE else None
+
 @ti.func
 def signed_distance(obj: SDFObject, pos: vec3) -> float:
     position = obj.transform.position
@@ -213,7 +221,12 @@ def signed_distance(obj: SDFObject, pos: vec3) -> float:
     # 动画
     p = angle(vec3(0, 0, pi*float(u_frame[None])/120.0)) @ p
 
-    return sd_bunny(p)
+    sd = 0.0
+    if ti.static(BRICK_CACHE):
+        sd = bunny_bricks.distance(p)
+    else:
+        sd = sd_bunny(p)
+    return sd
 
 WORLD_LIST = [
     SDFObject(type=SHAPE_BUNNY,
@@ -426,6 +439,8 @@ def render(
         image_buffer[i, j] = buffer
         image_pixels[i, j] = color
 
+if BRICK_CACHE: bunny_bricks.bake()
+
 window = ti.ui.Window("Taichi Renderer", image_resolution)
 canvas = window.get_canvas()
 camera = ti.ui.Camera()
@@ -4,6 +4,8 @@
 import taichi as ti
 from taichi.math import *
 
+from bricks import Bricks
+
 ti.init(arch=ti.gpu, default_ip=ti.i32, default_fp=ti.f32)
 
 image_resolution = (1920, 1080)
@@ -27,6 +29,18 @@ MAX_RAYTRACE = 512
 SHAPE_NONE     = 0
 SHAPE_BUNNY    = 1
 
+BRICK_CACHE  = False # bake the network into narrow-band bricks
+BRICK_COUNT  = 32   # bricks per edge of the [-1, 1] cube
+BRICK_CELLS  = 7    # cells per edge of a brick, 8 samples keep blocks a power of two
+
+LITE_BOUNCES = False # trace bounces with sd_bunny_lite, from distill_bunny.py
+LITE_ERROR   = 0.05  # its worst error near the surface as printed there, 0.041, rounded up
+
+# the bricks only run a network within a shell thinner than LITE_ERROR, where
+# sd_bunny_bounce hands over to sd_bunny anyway, so the two never compose
+if BRICK_CACHE and LITE_BOUNCES:
+    raise ValueError('BRICK_CACHE and LITE_BOUNCES are mutually exclusive')
+
 ENV_IOR = 1.000277
 
 aspect_ratio    = image_resolution[0] / image_resolution[1]
@@ -203,7 +217,34 @@ def sd_bunny(p: vec3) -> float: # from https://www.shadertoy.com/view/wtVyWK
     return sd
 
 @ti.func
-def signed_distance(obj: SDFObject, pos: vec3) -> float:
+def sd_bunny_lite(p: vec3) -> float: # from distill_bunny.py, a sixth of the multiply-adds
+    sd = 0.0
+    if length(p) > 1.0:
+        sd = length(p) - 0.8
+    else:
+        f00=sin(p.x*vec4(.478,-2.604,.183,2.717)+p.y*vec4(-3.095,.034,1.368,1.681)+p.z*vec4(-1.991,1.546,-1.158,-1.889)+vec4(1.382,-1.379,3.224,2.573))
+        f01=sin(p.x*vec4(1.478,-.874,-1.683,-1.224)+p.y*vec4(-2.792,2.829,-.552,.713)+p.z*vec4(3.871,.084,-1.958,1.274)+vec4(1.356,1.335,1.136,-.608))
+        f10=sin(f00@mat4(-.472,.556,-.397,-.855,.583,-.218,.406,1.936,.570,-.736,.139,-.328,-.367,-.284,-.380,-.662)+f01@mat4(.468,.385,.264,-1.355,.242,.394,-.333,.570,.988,.297,-.669,-1.540,-.561,.562,-1.224,.594)+vec4(-.419,.131,.668,.378))+f00
+        f11=sin(f00@mat4(-.395,-1.092,.722,-2.025,-1.350,.979,-.065,-.017,-.154,.712,-1.409,-1.980,-.030,.389,.359,.585)+f01@mat4(-1.800,.395,.116,-.882,-.545,2.209,1.324,1.556,-1.250,1.467,.533,.724,1.007,.616,.545,.898)+vec4(-.684,-.398,.811,-.518))+f01
+        sd = dot(f10,vec4(-.228,.363,.211,.038))+dot(f11,vec4(-.031,-.086,-.071,-.072))+0.291
+
+    return sd
+
+@ti.func
+def sd_bunny_bounce(p: vec3) -> float:
+    # the small network only steers the march while it is sure of the side
+    # of the surface, the exact one takes over within its error of it
+    sd = sd_bunny_lite(p)
+    if abs(sd) < LITE_ERROR + MIN_DIS:
+        sd = sd_bunny(p)
+    else:
+        sd = sign(sd) * (abs(sd) - LITE_ERROR)
+    return sd
+
+bunny_bricks = Bricks(sd_bunny, BRICK_COUNT, BRICK_CELLS) if BRICK_CACHE else None
+
+@ti.func
+def signed_distance(obj: SDFObject, pos: vec3, lite: bool) -> float:
     position = obj.transform.position
     rotation = obj.transform.rotation
     scale    = obj.transform.scale
@@ -214,7 +255,12 @@ def signed_distance(obj: SDFObject, pos: vec3) -> float:
     t  = pi * float(u_frame[None]) / 120.0
     p  = angle(vec3(0, 0, t)) @ p
     p += vec3(0, 0, 0.1*sin(t)) 
-    obj.distance = sd_bunny(p)
+    if ti.static(BRICK_CACHE):
+        obj.distance = bunny_bricks.distance(p)
+    elif ti.static(LITE_BOUNCES) and lite:
+        obj.distance = sd_bunny_bounce(p)
+    else:
+        obj.distance = sd_bunny(p)
 
     return obj.distance
 
@@ -229,29 +275,30 @@ objects = SDFObject.field(shape=objects_num)
 for i in range(objects_num): objects[i] = WORLD_LIST[i]
 
 @ti.func
-def nearest_object(p: vec3) -> SDFObject:
-    o = objects[0]; o.distance = abs(signed_distance(o, p))
+def nearest_object(p: vec3, lite: bool) -> SDFObject:
+    o = objects[0]; o.distance = abs(signed_distance(o, p, lite))
     for i in range(1, objects_num):
         oi = objects[i]
-        oi.distance = abs(signed_distance(oi, p))
+        oi.distance = abs(signed_distance(oi, p, lite))
         if oi.distance < o.distance: o = oi
     return o
 
 @ti.func
 def calc_normal(obj: SDFObject, p: vec3) -> vec3:
+    # shading always sees the exact surface
     e = vec2(1, -1) * PRECISION
-    return normalize(e.xyy * signed_distance(obj, p + e.xyy) + \
-                     e.yyx * signed_distance(obj, p + e.yyx) + \
-                     e.yxy * signed_distance(obj, p + e.yxy) + \
-                     e.xxx * signed_distance(obj, p + e.xxx) )
+    return normalize(e.xyy * signed_distance(obj, p + e.xyy, False) + \
+                     e.yyx * signed_distance(obj, p + e.yyx, False) + \
+                     e.yxy * signed_distance(obj, p + e.yxy, False) + \
+                     e.xxx * signed_distance(obj, p + e.xxx, False) )
 
 @ti.func
-def raycast(ray: Ray) -> HitRecord:
+def raycast(ray: Ray, lite: bool) -> HitRecord:
     record = HitRecord(); t = MIN_DIS
     w, s, d, cerr = 0.5, 0.0, 0.0, 1e32
     for _ in range(MAX_RAYMARCH):
         record.position = ray.at(t)
-        record.object   = nearest_object(record.position)
+        record.object   = nearest_object(record.position, lite)
 
         ld = d; d = record.object.distance
         if w > 1.0 and ld + d < s:
@@ -349,7 +396,8 @@ def raytrace(ray: Ray) -> Ray:
             ray.color *= roulette_prob
             break
 
-        record = raycast(ray)
+        # past the first bounce the error of the small network is not visible
+        record = raycast(ray, ti.static(LITE_BOUNCES) and i > 0)
 
         if not record.hit:
             ray.color *= sky_color(ray)
@@ -431,6 +479,8 @@ def render():
 
         image_pixels[i, j] = color
 
+if BRICK_CACHE: bunny_bricks.bake()
+
 camera = ti.ui.Camera()
 camera.position(0, 0, 4)
 
@@ -4,6 +4,8 @@
 import taichi as ti
 from taichi.math import *
 
+from bricks import Bricks
+
 ti.init(arch=ti.gpu, default_ip=ti.i32, default_fp=ti.f32)
 
 image_resolution = (3840, 2160)
@@ -27,6 +29,10 @@ MAX_RAYTRACE = 128
 SHAPE_NONE     = 0
 SHAPE_BUNNY    = 1
 
+BRICK_CACHE  = False # bake the network into narrow-band bricks
+BRICK_COUNT  = 32   # bricks per edge of the [-1, 1] cube
+BRICK_CELLS  = 7    # cells per edge of a brick, 8 samples keep blocks a power of two
+
 ENV_IOR = 1.000277
 
 aspect_ratio    = image_resolution[0] / image_resolution[1]
@@ -202,6 +208,8 @@ def sd_bunny(p: vec3) -> float: # from https://www.shadertoy.com/view/wtVyWK
 
     return sd
 
+bunny_bricks = Bricks(sd_bunny, BRICK_COUNT, BRICK_CELLS) if BRICK_CACHE else None
+
 @ti.func
 def signed_distance(obj: SDFObject, pos: vec3) -> float:
     position = obj.transform.position
@@ -214,7 +222,10 @@ def signed_distance(obj: SDFObject, pos: vec3) -> float:
     t  = pi * float(u_frame[None]) / 120.0
     p  = angle(vec3(0, 0, t)) @ p
     p += vec3(0, 0, 0.1*sin(t)) 
-    obj.distance = sd_bunny(p)
+    if ti.static(BRICK_CACHE):
+        obj.distance = bunny_bricks.distance(p)
+    else:
+        obj.distance = sd_bunny(p)
 
     return obj.distance
 
@@ -431,6 +442,8 @@ def render(
         image_buffer[i, j] = buffer
         image_pixels[i, j] = color
 
+if BRICK_CACHE: bunny_bricks.bake()
+
 window = ti.ui.Window("Taichi Renderer", image_resolution, show_window=False)
 canvas = window.get_canvas()
 camera = ti.ui.Camera()
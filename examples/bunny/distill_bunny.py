@@ -0,0 +1,148 @@
+# distills the network of sd_bunny() into a smaller one of the same kind,
+# fitted hardest near the surface where rays end up evaluating it
+# usage: python examples/bunny/distill_bunny.py [assets/bunny_lite.npz] [--width 8] [--depth 1]
+# writes an .npz for src/neural.py and prints a taichi function to inline,
+# bunny_sdf_glass.py traces bounces with the one printed by the defaults
+
+import re
+import argparse
+import numpy as np
+
+from export_bunny import bunny_network
+
+
+def forward(net: dict, p: np.ndarray, cache: list = None) -> np.ndarray:
+    z = p @ net['w0'].T + net['b0']
+    h = np.sin(z)
+    if cache is not None:
+        cache.append((p, z))
+
+    for k in range(1, len(net['gain']) + 1):
+        z = h @ net[f'w{k}'].T + net[f'b{k}']
+        if cache is not None:
+            cache.append((h, z))
+        h = np.sin(z) * net['gain'][k - 1] + h * net['residual'][k - 1]
+
+    if cache is not None:
+        cache.append((h, None))
+    n = len(net['gain']) + 1
+    return (h @ net[f'w{n}'].T + net[f'b{n}'])[:, 0]
+
+
+def backward(net: dict, cache: list, dy: np.ndarray) -> dict:
+    n = len(net['gain']) + 1
+    h, _ = cache[-1]
+    grads = {f'w{n}': dy[None] @ h, f'b{n}': dy.sum(keepdims=True)}
+    dh = dy[:, None] @ net[f'w{n}']
+
+    for k in range(n - 1, -1, -1):
+        x, z = cache[k]
+        gain = net['gain'][k - 1] if k > 0 else 1.0
+        dz = dh * np.cos(z) * gain
+        grads[f'w{k}'], grads[f'b{k}'] = dz.T @ x, dz.sum(0)
+        if k > 0:
+            dh = dz @ net[f'w{k}'] + dh * net['residual'][k - 1]
+
+    return grads
+
+
+def sample(teacher: dict, count: int, rng: np.random.Generator) -> tuple:
+    # mostly points close to the surface, some anywhere in the unit ball
+    p = rng.uniform(-1, 1, (count * 8, 3))
+    p = p[np.linalg.norm(p, axis=1) < 1.0]
+    d = forward(teacher, p)
+    near = np.abs(d) < 0.05
+    p = np.concatenate([p[near][:count * 3 // 4], p[~near][:count // 4]])
+    return p, forward(teacher, p)
+
+
+def distill(teacher: dict, width: int, depth: int, steps: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    bound = np.sqrt(6.0 / width)
+    student = {'w0': rng.uniform(-3, 3, (width, 3)), 'b0': rng.uniform(-np.pi, np.pi, width)}
+    for k in range(1, depth + 1):
+        student[f'w{k}'] = rng.uniform(-bound, bound, (width, width))
+        student[f'b{k}'] = np.zeros(width)
+    student[f'w{depth + 1}'] = rng.uniform(-bound, bound, (1, width)) * 0.1
+    student[f'b{depth + 1}'] = np.zeros(1)
+
+    fixed = {'gain': np.ones(depth), 'residual': np.ones(depth)}
+    params = list(student)
+    student.update(fixed)
+
+    # adam with a cosine decay
+    m = {k: np.zeros_like(student[k]) for k in params}
+    v = {k: np.zeros_like(student[k]) for k in params}
+    for step in range(1, steps + 1):
+        p, d = sample(teacher, 4096, rng)
+        cache = []
+        y = forward(student, p, cache)
+        weight = 1.0 / (np.abs(d) + 0.01)
+        grads = backward(student, cache, 2.0 * weight * (y - d) / len(d))
+
+        lr = 1e-4 + 0.5 * (3e-3 - 1e-4) * (1 + np.cos(np.pi * step / steps))
+        for k in params:
+            m[k] = 0.9 * m[k] + 0.1 * grads[k]
+            v[k] = 0.999 * v[k] + 0.001 * grads[k] ** 2
+            mh, vh = m[k] / (1 - 0.9 ** step), v[k] / (1 - 0.999 ** step)
+            student[k] -= lr * mh / (np.sqrt(vh) + 1e-8)
+
+    return student
+
+
+def taichi_source(net: dict, name: str, radius: float) -> str:
+    # the same literal style as sd_bunny(), f @ mat4 is f^T M by rows
+    def num(x):
+        return re.sub(r'^(-?)0\.', r'\1.', f'{x:.3f}')
+
+    def vec4(v):
+        return 'vec4(' + ','.join(num(x) for x in v) + ')'
+
+    def mat4(w):
+        return 'mat4(' + ','.join(num(x) for x in w.T.reshape(-1)) + ')'
+
+    chunks = len(net['b0']) // 4
+    depth = len(net['gain'])
+    lines = ['@ti.func', f'def {name}(p: vec3) -> float:',
+             '    sd = 0.0',
+             '    if length(p) > 1.0:',
+             f'        sd = length(p) - {radius}',
+             '    else:']
+    for k in range(chunks):
+        w, b = net['w0'][4 * k:4 * k + 4], net['b0'][4 * k:4 * k + 4]
+        lines.append(f'        f0{k}=sin(p.x*{vec4(w[:, 0])}+p.y*{vec4(w[:, 1])}+p.z*{vec4(w[:, 2])}+{vec4(b)})')
+
+    for l in range(1, depth + 1):
+        src, dst = (l - 1) % 2, l % 2
+        for k in range(chunks):
+            w, b = net[f'w{l}'], net[f'b{l}']
+            terms = '+'.join(f'f{src}{m}@{mat4(w[4 * k:4 * k + 4, 4 * m:4 * m + 4])}' for m in range(chunks))
+            lines.append(f'        f{dst}{k}=sin({terms}+{vec4(b[4 * k:4 * k + 4])})+f{src}{k}')
+
+    last = depth % 2
+    w, b = net[f'w{depth + 1}'][0], net[f'b{depth + 1}'][0]
+    out = '+'.join(f'dot(f{last}{k},{vec4(w[4 * k:4 * k + 4])})' for k in range(chunks))
+    lines.append(f'        sd = {out}{b:+.3f}')
+    lines += ['', '    return sd']
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='?', default='assets/bunny_lite.npz')
+    parser.add_argument('--width', type=int, default=8)
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--steps', type=int, default=20000)
+    args = parser.parse_args()
+
+    teacher = bunny_network()
+    student = distill(teacher, args.width, args.depth, args.steps)
+
+    p, d = sample(teacher, 100000, np.random.default_rng(1))
+    error = np.abs(forward(student, p) - d)[np.abs(d) < 0.01]
+    print(f'error near the surface: mean {error.mean():.4f}, max {error.max():.4f}')
+
+    np.savez(args.path, **{k: v.astype(np.float32) for k, v in student.items()},
+             radius=teacher['radius'], lipschitz=1.0)
+    print('wrote', args.path)
+    print(taichi_source(student, 'sd_bunny_lite', teacher['radius']))
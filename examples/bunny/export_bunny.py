@@ -0,0 +1,51 @@
+# writes the network inlined in sd_bunny() as an .npz for src/neural.py
+# usage: python examples/bunny/export_bunny.py [assets/bunny.npz]
+
+import os
+import re
+import sys
+import numpy as np
+
+
+def bunny_network() -> dict:
+    here = os.path.dirname(os.path.abspath(__file__))
+    source = open(os.path.join(here, 'bunny_sdf.py'), encoding='utf-8').read()
+    source = source[source.index('def sd_bunny'):]
+    source = source[:source.index('return sd')]
+
+    vectors = [np.array(v.split(','), np.float32)
+               for v in re.findall(r'(?:vec4|mat4)\(([^()]*)\)', source)]
+
+    # input layer, sin(p.y * a + p.z * b - p.x * c + d) for each vec4 of units
+    w0, b0 = np.zeros((16, 3), np.float32), np.zeros(16, np.float32)
+    for k in range(4):
+        a, b, c, d = vectors[4 * k:4 * k + 4]
+        w0[4 * k:4 * k + 4] = np.stack([-c, a, b], axis=1)
+        b0[4 * k:4 * k + 4] = d
+    vectors = vectors[16:]
+
+    # hidden layers, each vec4 of units is the sum of f @ mat4 over the inputs
+    hidden = []
+    for _ in range(2):
+        w, b = np.zeros((16, 16), np.float32), np.zeros(16, np.float32)
+        for k in range(4):
+            for m in range(4):
+                w[4 * k:4 * k + 4, 4 * m:4 * m + 4] = vectors[m].reshape(4, 4).T
+            b[4 * k:4 * k + 4] = vectors[4]
+            vectors = vectors[5:]
+        hidden.append((w, b))
+
+    (w1, b1), (w2, b2) = hidden
+    w3 = np.concatenate(vectors[:4])[None]
+    b3 = np.array([-0.16], np.float32)
+
+    return dict(w0=w0, b0=b0, w1=w1, b1=b1, w2=w2, b2=b2, w3=w3, b3=b3,
+                gain=np.array([1.0, 1.0 / 1.4], np.float32),
+                residual=np.array([1.0, 1.0], np.float32),
+                radius=0.8, lipschitz=1.0)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'assets/bunny.npz'
+    np.savez(path, **bunny_network())
+    print('wrote', path)
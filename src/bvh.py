@@ -0,0 +1,52 @@
+import numpy as np
+import taichi as ti
+
+
+from .dataclass import AABB, BVHNode
+
+
+@ti.data_oriented
+class BVH:
+    def __init__(self, capacity: int):
+        self.boxes = AABB.field(shape=capacity)
+        self.nodes = BVHNode.field(shape=max(2 * capacity - 1, 1))
+        self.size = ti.field(dtype=ti.i32, shape=())
+
+    def build(self, indices: list[int]):
+        boxes = self.boxes.to_numpy()
+        lower, upper = boxes['lower'], boxes['upper']
+        center = 0.5 * (lower + upper)
+
+        nodes = []
+
+        # nodes are stored in depth-first order, so the left child of a node
+        # always follows it and `skip` points past the whole subtree
+        def split(indices: np.ndarray):
+            node = [lower[indices].min(0), upper[indices].max(0), -1, 0]
+            nodes.append(node)
+
+            if len(indices) == 1:
+                node[2] = indices[0]
+            else:
+                axis = np.ptp(center[indices], axis=0).argmax()
+                order = indices[np.argsort(center[indices, axis])]
+                split(order[:len(order) // 2])
+                split(order[len(order) // 2:])
+
+            node[3] = len(nodes)
+
+        if len(indices) > 0:
+            split(np.array(indices))
+
+        size = self.nodes.shape[0]
+        lowers = np.zeros((size, 3), np.float32)
+        uppers = np.zeros((size, 3), np.float32)
+        objects = np.full(size, -1, np.int32)
+        skips = np.zeros(size, np.int32)
+
+        for i, (lo, hi, obj, skip) in enumerate(nodes):
+            lowers[i], uppers[i], objects[i], skips[i] = lo, hi, obj, skip
+
+        self.nodes.from_numpy({'box': {'lower': lowers, 'upper': uppers},
+                               'object': objects, 'skip': skips})
+        self.size[None] = len(nodes)
@@ -1,9 +1,9 @@
 import taichi as ti
-from taichi.math import pi, vec2, vec3, radians, normalize, cross, tan, clamp
+from taichi.math import pi, vec2, vec3, vec4, radians, normalize, cross, tan, clamp, dot
 from taichi.ui.utils import euler_to_vec, vec_to_euler
 
 from .dataclass import Ray, Camera
-from .config import SCREEN_PIXEL_SIZE
+from .config import SCREEN_PIXEL_SIZE, PIXEL_RADIUS
 from .util import random_in_unit_disk
 from .fileds import u_frame
 
@@ -33,7 +33,38 @@ def get_ray(c: Camera, uv: vec2, color: vec3) -> Ray:
     po = lower_left_corner + uv.x * horizontal + uv.y * vertical
     rd = normalize(po - ro)
 
-    return Ray(ro, rd, color)
+    return Ray(ro, rd, color, 0, PIXEL_RADIUS)
+
+
+@ti.func
+def project_sphere(c: Camera, center: vec3, radius: float) -> vec4:
+    theta = radians(c.vfov)
+    half_height = tan(theta * 0.5)
+    half_width = c.aspect * half_height
+
+    z = normalize(c.lookfrom - c.lookat)
+    x = normalize(cross(c.vup, z))
+    y = cross(z, x)
+
+    d = center - c.lookfrom
+    v = vec3(dot(d, x), dot(d, y), -dot(d, z))
+
+    # rays leave from anywhere on the lens and meet at the focus plane
+    radius += c.aperture * 0.5 * (1.0 + (v.z + radius) / c.focus)
+
+    rect = vec4(0, 0, 1, 1)  # (lower uv, upper uv)
+    if v.z + radius < 0:
+        rect = vec4(1, 1, 0, 0)
+    elif v.z - radius > 0:
+        # x / z over the view space box of the sphere peaks at its corners
+        near, far = v.z - radius, v.z + radius
+        lower = min((v.xy - radius) / near, (v.xy - radius) / far)
+        upper = max((v.xy + radius) / near, (v.xy + radius) / far)
+
+        size = 2.0 * vec2(half_width, half_height)
+        rect = vec4(lower / size + 0.5, upper / size + 0.5)
+
+    return rect
 
 
 @ti.data_oriented
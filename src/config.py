@@ -12,6 +12,28 @@ QUALITY_PER_SAMPLE = 0.8  # for russian roulette
 
 BLACK_BACKGROUND = False
 ADAPTIVE_SAMPLING = False
+BVH_ACCELERATION = False  # for scenes with many objects
+DISTANCE_CACHE = False  # for scenes with expensive SDFs
+RAY_CULLING = False  # march only over objects the ray may hit
+TILE_BINNING = False  # per-tile object lists for primary rays
+ANALYTIC_INTERSECTION = False  # closed-form hits instead of marching primitives
+ANALYTIC_NORMAL = True  # exact normals instead of finite differences
+DYNAMIC_SCENE = False  # edit objects at runtime without recompiling
+DOMAIN_REPETITION = False  # let objects repeat, which folds every point they see
+DISTANCE_GRID = False  # skip empty space with baked distance bounds
+WARM_START = False  # start primary rays where the last frame proved empty
+HIT_REFINEMENT = False  # converge on bracketed hits instead of creeping up
+MARCH_STATS = False  # count rays that run out of steps, printed every second
+RAY_CONES = False  # looser hits for blurry bounces, which end their march sooner
+LOD_PROXIES = False  # cheap stand-ins for far objects that declare a lod
+SHAPE_GROUPS = False  # evaluate objects type by type from contiguous arrays, unless proxies or distance bounds are on
+WAVEFRONT = False  # trace in stages over compacted queues of paths
+SHADER_REORDERING = False  # sort wavefront hits by shape and material before shading
+REORDER_DIRECTIONS = False  # and sort rays by direction octant as well
+LIGHT_SAMPLING = False  # sample emitters directly from diffuse bounces
+ENV_SAMPLING = False  # and sample the environment map from them as well
+MULTIPLE_IMPORTANCE = False  # weigh those samples against bounces that find the same light
+MIS_POWER = 2.0  # of the heuristic, 1 for balance and 2 for power
 
 VISIBILITY = vec2(1e-4, 1e4)
 NOISE_THRESHOLD = 1e-4  # for self-adaptive sampling
@@ -25,4 +47,27 @@ MAX_DIS = 1e3
 MAX_RAYMARCH = 512
 MAX_RAYTRACE = 512
 
+TILE_SIZE = 16  # in pixels
+TILE_CAPACITY = 32  # objects per tile before falling back to all objects
+SCENE_CAPACITY = 64  # objects a dynamic scene can hold
+GRID_RESOLUTION = 64  # cells per axis of the distance grid
+GRID_EXTENT = 16.0  # the grid covers at most this far from the origin
+WARM_PIXELS = 2.0  # width of that proof, one pixel of jitter and the rest for turning
+WARM_RADIUS = 0.1  # and its width at the lens, for moving the camera
+REFINE_STEPS = 4  # secant steps on a bracketed hit
+REFINE_BAND = 8.0  # look for a hit ahead within this many hit tolerances
+CONE_MAX_SPREAD = 8.0  # loosest hit tolerance of a ray cone, in pixels
+ENV_LEVELS = 8  # mip levels of the environment map
+NEURAL_CAPACITY = 4  # neural shapes that can be loaded at once
+NEURAL_WIDTH = 16  # widest layer of a neural shape, a multiple of 4
+NEURAL_DEPTH = 4  # most hidden layers of a neural shape
+CSG_CAPACITY = 8  # composite shapes that can be loaded at once
+CSG_LENGTH = 64  # most instructions of a composite
+CSG_STACK = 8  # most distances a composite holds while it is evaluated
+MESH_CAPACITY = 4  # baked meshes that can be loaded at once
+MESH_RESOLUTION = 64  # cells per axis of a baked mesh
+MESH_BRICK = 8  # cells per edge of a brick of a baked mesh
+MESH_BRICKS = 1024  # bricks shared by every baked mesh
+MESH_CACHE = 'assets/cache'  # where baked meshes are kept
+
 ENV_IOR = 1.000277
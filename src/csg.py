@@ -0,0 +1,310 @@
+import taichi as ti
+from taichi.math import vec3, length, radians, normalize
+from enum import IntEnum
+
+
+from .config import MAX_DIS, CSG_CAPACITY, CSG_LENGTH, CSG_STACK
+from .dataclass import Transform, Instruction, Dual
+from .util import rotate
+from . import sdf  # which loads this module for its tables, so only used in kernels
+
+
+# composites of primitives, compiled into a tape of instructions in
+# post-order, which one interpreter evaluates with a stack of distances
+#   tree = smooth_union(primitive(SHAPE.SPHERE, Transform(...)),
+#                       subtraction(primitive(SHAPE.BOX, ...),
+#                                   primitive(SHAPE.CYLINDER, ...)), 0.1)
+#   SDFObject(type=SHAPE.CSG,
+#             transform=Transform(..., scale=vec3(tapes.load(tree), 0, 0)), ...)
+# editing a composite with tapes.update() only uploads its tape
+
+
+class OP(IntEnum):
+    BOUND = 0  # skips the subtree that follows while p is far from it
+    PRIMITIVE = 1
+    UNION = 2
+    INTERSECTION = 3
+    SUBTRACTION = 4
+    SMOOTH_UNION = 5
+
+
+def primitives() -> list:
+    # shapes a composite can be made of
+    return [shape for shape in sdf.SHAPE if shape not in (sdf.SHAPE.NONE, sdf.SHAPE.CSG)]
+
+
+class Node:
+    def __init__(self, op: OP, children: tuple = (), shape: int = 0,
+                 transform: Transform = None, blend: float = 0.0):
+        self.op, self.children, self.blend = op, children, blend
+        self.shape, self.transform = shape, transform
+
+
+def primitive(shape: int, transform: Transform) -> Node:
+    return Node(OP.PRIMITIVE, shape=shape, transform=transform)
+
+
+def union(a: Node, b: Node) -> Node:
+    return Node(OP.UNION, (a, b))
+
+
+def intersection(a: Node, b: Node) -> Node:
+    return Node(OP.INTERSECTION, (a, b))
+
+
+def subtraction(a: Node, b: Node) -> Node:
+    return Node(OP.SUBTRACTION, (a, b))  # a without b
+
+
+def smooth_union(a: Node, b: Node, blend: float) -> Node:
+    return Node(OP.SMOOTH_UNION, (a, b), blend=blend)
+
+
+def depth(node: Node) -> int:
+    # distances on the stack while the node is evaluated
+    if node.op == OP.PRIMITIVE:
+        return 1
+    a, b = node.children
+    return max(depth(a), depth(b) + 1)
+
+
+def assemble(tree: Node) -> list[Instruction]:
+    code = []
+
+    def emit(node: Node, margin: float, root: bool) -> int:
+        if node.op == OP.PRIMITIVE:
+            code.append(Instruction(op=OP.PRIMITIVE, shape=node.shape,
+                                    transform=node.transform))
+            return len(code) - 1
+
+        # the bound of a subtree stands in for it only where no operator
+        # above can blend it with anything else
+        header = -1
+        if not root:
+            header = len(code)
+            code.append(None)  # until the end of the subtree is known
+
+        a, b = node.children
+        left = emit(a, margin + node.blend, False)
+        right = emit(b, margin + node.blend, False)
+        code.append(Instruction(op=node.op, blend=node.blend, left=left, right=right))
+
+        if header >= 0:
+            code[header] = Instruction(op=OP.BOUND, blend=margin, skip=len(code))
+        return len(code) - 1
+
+    emit(tree, 0.0, True)
+    return code
+
+
+@ti.func
+def smin(a: float, b: float, k: float) -> float:
+    # from https://iquilezles.org/articles/smin/
+    h = max(k - abs(a - b), 0.0) / max(k, 1e-12)
+    return min(a, b) - h * h * k * 0.25
+
+
+@ti.func
+def enclose(a: Instruction, b: Instruction) -> tuple[vec3, float]:
+    # the smallest sphere around the spheres of both nodes
+    center, radius = a.center, a.radius
+    d = length(b.center - a.center)
+    if d + a.radius <= b.radius:
+        center, radius = b.center, b.radius
+    elif d + b.radius > a.radius:
+        radius = 0.5 * (d + a.radius + b.radius)
+        center += (b.center - a.center) / d * (radius - a.radius)
+    return center, radius
+
+
+@ti.data_oriented
+class Tapes:
+    def __init__(self, capacity: int, size: int, stack: int):
+        self.capacity, self.size, self.stack = capacity, size, stack
+        self.count, self.allocated = 0, False
+
+    def allocate(self):
+        # only once a scene compiles the shape in, or loads a composite
+        if self.allocated:
+            return
+        self.allocated = True
+        self.code = Instruction.field(shape=(self.capacity, self.size))
+        self.length = ti.field(dtype=ti.i32, shape=self.capacity)
+
+    def load(self, tree: Node) -> int:
+        self.allocate()
+        if self.count >= self.capacity:
+            raise ValueError(f'no room for more than {self.capacity} composites')
+
+        self.count += 1
+        self.update(self.count - 1, tree)
+        return self.count - 1
+
+    def update(self, n: int, tree: Node):
+        if not 0 <= n < self.count:
+            raise IndexError(f'no composite at {n}')
+        if depth(tree) > self.stack:
+            raise ValueError(f'the composite needs a stack deeper than {self.stack}')
+        code = assemble(tree)
+        if len(code) > self.size:
+            raise ValueError(f'{len(code)} instructions exceed the tape of {self.size}')
+
+        for i, instruction in enumerate(code):
+            self.code[n, i] = instruction
+        self.length[n] = len(code)
+        self.prepare(n)
+
+    @ti.kernel
+    def prepare(self, n: int):
+        # operands come before their operator, so one pass in order
+        # finds every bounding sphere
+        ti.loop_config(serialize=True)
+        for i in range(self.length[n]):
+            code = self.code[n, i]
+            if code.op == OP.PRIMITIVE:
+                t = code.transform
+                t.matrix = rotate(radians(t.rotation))
+                center, extent = vec3(0), vec3(MAX_DIS)
+                for shape in ti.static(primitives()):
+                    if code.shape == shape:
+                        center, extent = sdf.SHAPE_BOUND[shape](t.scale)
+
+                reach = ti.select(t.copies > 0, t.repeat * t.copies, MAX_DIS)
+                extent += ti.select(t.repeat > 0, reach, 0.0)
+
+                self.code[n, i].transform.matrix = t.matrix
+                self.code[n, i].center = t.position + t.matrix.transpose() @ center
+                self.code[n, i].radius = length(extent)
+            elif code.op != OP.BOUND:
+                a, b = self.code[n, code.left], self.code[n, code.right]
+                center, radius = a.center, a.radius  # a subtraction is inside a
+                if code.op == OP.INTERSECTION:
+                    if b.radius < a.radius:
+                        center, radius = b.center, b.radius
+                elif code.op != OP.SUBTRACTION:
+                    center, radius = enclose(a, b)
+                    radius += 0.25 * code.blend  # a blend bulges out by up to k/4
+
+                self.code[n, i].center = center
+                self.code[n, i].radius = radius
+
+    @ti.func
+    def leaf(self, n: int, i: int, p: vec3) -> float:
+        shape, t = self.code[n, i].shape, self.code[n, i].transform
+        dis = MAX_DIS
+        for s in ti.static(primitives()):
+            if shape == s:
+                dis = sdf.SHAPE_FUNC[s](sdf.transform(t, p), t.scale) / sdf.SHAPE_LIPSCHITZ[s](t.scale)
+        return dis
+
+    @ti.func
+    def evaluate(self, n: int, p: vec3) -> float:
+        stack = ti.Vector.zero(float, self.stack)
+        top, i = 0, 0
+        while i < self.length[n]:
+            op, after = self.code[n, i].op, i + 1
+
+            if op == OP.BOUND:
+                # the distance to the sphere is a lower bound of the subtree,
+                # which keeps every operator conservative once it is positive
+                skip = self.code[n, i].skip
+                root = self.code[n, skip - 1]
+                dis = length(p - root.center) - root.radius
+                if dis > self.code[n, i].blend:
+                    stack[top] = dis
+                    top += 1
+                    after = skip
+            elif op == OP.PRIMITIVE:
+                stack[top] = self.leaf(n, i, p)
+                top += 1
+            else:
+                top -= 1
+                a, b, k = stack[top - 1], stack[top], self.code[n, i].blend
+                if op == OP.UNION:
+                    stack[top - 1] = min(a, b)
+                elif op == OP.INTERSECTION:
+                    stack[top - 1] = max(a, b)
+                elif op == OP.SUBTRACTION:
+                    stack[top - 1] = max(a, -b)
+                else:
+                    stack[top - 1] = smin(a, b, k)
+
+            i = after
+
+        return stack[0]
+
+    @ti.func
+    def leaf_gradient(self, n: int, i: int, p: vec3) -> Dual:
+        shape, t = self.code[n, i].shape, self.code[n, i].transform
+        d = Dual(MAX_DIS, vec3(0))
+        for s in ti.static(primitives()):
+            if shape == s:
+                q = sdf.transform(t, p)
+                g = Dual(sdf.SHAPE_FUNC[s](q, t.scale), vec3(0))
+                if ti.static(s in sdf.SHAPE_GRAD):
+                    g = sdf.SHAPE_GRAD[s](q, t.scale)
+                else:
+                    g.grad = sdf.SHAPE_NORMAL[s](q, t.scale)  # exact distances slope by 1
+                lipschitz = sdf.SHAPE_LIPSCHITZ[s](t.scale)
+                d = Dual(g.value / lipschitz, t.matrix.transpose() @ g.grad / lipschitz)
+        return d
+
+    @ti.func
+    def gradient(self, n: int, p: vec3) -> Dual:
+        # evaluate() with a stack of gradients beside the distances
+        stack = ti.Vector.zero(float, self.stack)
+        grads = ti.Matrix.zero(float, self.stack, 3)
+        top, i = 0, 0
+        while i < self.length[n]:
+            op, after = self.code[n, i].op, i + 1
+
+            d, push = Dual(0.0, vec3(0)), False
+            if op == OP.BOUND:
+                skip = self.code[n, i].skip
+                root = self.code[n, skip - 1]
+                dis = length(p - root.center) - root.radius
+                if dis > self.code[n, i].blend:
+                    d, push = Dual(dis, normalize(p - root.center)), True
+                    after = skip
+            elif op == OP.PRIMITIVE:
+                d, push = self.leaf_gradient(n, i, p), True
+            else:
+                top -= 1
+                a = Dual(stack[top - 1], vec3(grads[top - 1, 0], grads[top - 1, 1], grads[top - 1, 2]))
+                b = Dual(stack[top], vec3(grads[top, 0], grads[top, 1], grads[top, 2]))
+                k = self.code[n, i].blend
+                if op == OP.SUBTRACTION:
+                    b = Dual(-b.value, -b.grad)
+
+                # the operand the operator picks, the larger for the
+                # intersection and the subtraction, the smaller otherwise
+                larger = op == OP.INTERSECTION or op == OP.SUBTRACTION
+                d = b
+                if (a.value > b.value) == larger:
+                    d = a
+
+                if op == OP.SMOOTH_UNION:
+                    # smin() is min(a, b) - h^2 k / 4, with h falling off
+                    # by one over k as a and b part
+                    h = max(k - abs(a.value - b.value), 0.0) / max(k, 1e-12)
+                    side = 1.0 if a.value > b.value else -1.0
+                    d = Dual(d.value - h * h * k * 0.25, d.grad + 0.5 * h * side * (a.grad - b.grad))
+                top -= 1
+                push = True
+
+            if push:
+                stack[top] = d.value
+                grads[top, 0], grads[top, 1], grads[top, 2] = d.grad.x, d.grad.y, d.grad.z
+                top += 1
+
+            i = after
+
+        return Dual(stack[0], vec3(grads[0, 0], grads[0, 1], grads[0, 2]))
+
+    @ti.func
+    def bound(self, n: int) -> tuple[vec3, vec3]:
+        root = self.code[n, self.length[n] - 1]
+        return root.center, vec3(root.radius)
+
+
+tapes = Tapes(CSG_CAPACITY, CSG_LENGTH, CSG_STACK)
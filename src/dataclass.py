@@ -8,6 +8,9 @@ class Ray:
     direction: vec3
     color: vec3
     depth: int
+    spread: float  # angle the ray cone widens by per unit distance
+    radiance: vec3  # light gathered by sampling emitters along the path
+    pdf: float  # of the direction of the last bounce, 0 for mirrors and refraction
 
 
 @ti.dataclass
@@ -26,6 +29,8 @@ class Transform:
     rotation: vec3
     scale: vec3
     matrix: mat3
+    repeat: vec3  # spacing of copies in local space, 0 on unrepeated axes
+    copies: vec3  # copies on each side, 0 repeats forever
 
 
 @ti.dataclass
@@ -33,6 +38,39 @@ class SDFObject:
     type: int
     transform: Transform
     material: Material
+    lod: float  # bound radii away where the bounding sphere stands in, 0 never
+
+
+@ti.dataclass
+class Instruction:
+    op: int
+    shape: int  # of a primitive
+    transform: Transform  # of a primitive
+    blend: float  # radius of a smooth union, or the margin of a bound
+    skip: int  # the instruction past the subtree of a bound
+    left: int  # operands of an operator
+    right: int
+    center: vec3  # bounding sphere of the node
+    radius: float
+
+
+@ti.dataclass
+class Dual:
+    value: float
+    grad: vec3
+
+
+@ti.dataclass
+class AABB:
+    lower: vec3
+    upper: vec3
+
+
+@ti.dataclass
+class BVHNode:
+    box: AABB
+    object: int  # -1 for inner nodes
+    skip: int  # next node once this subtree is culled
 
 
 @ti.dataclass
@@ -0,0 +1,91 @@
+import taichi as ti
+from taichi.math import vec3, sqrt, sin, cos
+
+
+from .dataclass import Dual
+
+
+# forward-mode differentiation: every value carries its gradient,
+# so a distance and its normal come out of a single evaluation
+
+
+@ti.func
+def dvar(p: vec3) -> tuple[Dual, Dual, Dual]:
+    return Dual(p.x, vec3(1, 0, 0)), Dual(p.y, vec3(0, 1, 0)), Dual(p.z, vec3(0, 0, 1))
+
+
+@ti.func
+def dconst(v: float) -> Dual:
+    return Dual(v, vec3(0))
+
+
+@ti.func
+def dadd(a: Dual, b: Dual) -> Dual:
+    return Dual(a.value + b.value, a.grad + b.grad)
+
+
+@ti.func
+def dsub(a: Dual, b: Dual) -> Dual:
+    return Dual(a.value - b.value, a.grad - b.grad)
+
+
+@ti.func
+def dmul(a: Dual, b: Dual) -> Dual:
+    return Dual(a.value * b.value, a.grad * b.value + b.grad * a.value)
+
+
+@ti.func
+def ddiv(a: Dual, b: Dual) -> Dual:
+    return Dual(a.value / b.value, (a.grad * b.value - b.grad * a.value) / (b.value * b.value))
+
+
+@ti.func
+def dscale(a: Dual, k: float) -> Dual:
+    return Dual(a.value * k, a.grad * k)
+
+
+@ti.func
+def doffset(a: Dual, k: float) -> Dual:
+    return Dual(a.value + k, a.grad)
+
+
+@ti.func
+def dsqrt(a: Dual) -> Dual:
+    v = sqrt(a.value)
+    return Dual(v, a.grad * 0.5 / max(v, 1e-12))
+
+
+@ti.func
+def dsin(a: Dual) -> Dual:
+    return Dual(sin(a.value), a.grad * cos(a.value))
+
+
+@ti.func
+def dcos(a: Dual) -> Dual:
+    return Dual(cos(a.value), -a.grad * sin(a.value))
+
+
+@ti.func
+def dabs(a: Dual) -> Dual:
+    return Dual(abs(a.value), a.grad * ti.select(a.value < 0, -1.0, 1.0))
+
+
+@ti.func
+def dmin(a: Dual, b: Dual) -> Dual:
+    c = a
+    if b.value < a.value:
+        c = b
+    return c
+
+
+@ti.func
+def dmax(a: Dual, b: Dual) -> Dual:
+    c = a
+    if b.value > a.value:
+        c = b
+    return c
+
+
+@ti.func
+def dlength(a: Dual, b: Dual) -> Dual:
+    return dsqrt(dadd(dmul(a, a), dmul(b, b)))
@@ -1,8 +1,8 @@
 import taichi as ti
 
 
-from .config import image_resolution, ADAPTIVE_SAMPLING
-from .dataclass import Ray
+from .config import image_resolution, ADAPTIVE_SAMPLING, WARM_START
+from .dataclass import Ray, Camera
 
 ray_buffer = Ray.field()
 image_buffer = ti.Vector.field(4, float)
@@ -23,3 +23,16 @@ if ADAPTIVE_SAMPLING:
 
     ti.root.dense(ti.ij, image_resolution).place(diff_buffer)
     ti.root.dense(ti.ij, image_resolution).place(diff_pixels)
+
+warm_buffer = None
+warm_slack = None
+warm_camera = None
+
+if WARM_START:
+    warm_buffer = ti.field(float)  # empty length in front of each pixel
+    warm_slack = ti.Vector.field(2, float)  # width of that proof not yet used up
+
+    ti.root.dense(ti.ij, image_resolution).place(warm_buffer)
+    ti.root.dense(ti.ij, image_resolution).place(warm_slack)
+
+    warm_camera = Camera.field(shape=())  # the camera the proofs are about
@@ -0,0 +1,37 @@
+import numpy as np
+import taichi as ti
+from taichi.math import vec3, ivec3, length
+
+
+@ti.data_oriented
+class DistanceGrid:
+    def __init__(self, resolution: int):
+        self.resolution = resolution
+        self.values = ti.field(dtype=ti.f32, shape=(resolution,) * 3)
+        self.lower = vec3.field(shape=())
+        self.cell = vec3.field(shape=())
+
+    def place(self, lower: np.ndarray, upper: np.ndarray):
+        upper = np.maximum(upper, lower)
+        self.lower[None] = lower
+        self.cell[None] = (upper - lower) / self.resolution
+
+    @ti.func
+    def center(self, I: ivec3) -> vec3:
+        return self.lower[None] + (I + 0.5) * self.cell[None]
+
+    @ti.func
+    def radius(self) -> float:
+        return 0.5 * length(self.cell[None])
+
+    @ti.func
+    def lookup(self, p: vec3) -> float:
+        # a lower bound of the scene distance anywhere inside the cell,
+        # or 0 where it is not worth more than an exact evaluation
+        bound = 0.0
+        q = (p - self.lower[None]) / max(self.cell[None], 1e-12)
+        if (q >= 0).all() and (q < self.resolution).all():
+            bound = self.values[ti.cast(q, ti.i32)]
+            if bound < self.radius():
+                bound = 0.0
+        return bound
@@ -0,0 +1,44 @@
+import numpy as np
+import taichi as ti
+from taichi.math import vec3, mat3
+
+
+@ti.data_oriented
+class ShapeGroups:
+    def __init__(self, capacity: int, shapes: int):
+        # objects sorted by type, the objects of shape s are the slots
+        # from start[s] up to start[s + 1]
+        self.start = ti.field(dtype=ti.i32, shape=shapes + 1)
+        self.index = ti.field(dtype=ti.i32, shape=capacity)  # object of each slot
+
+        # transforms as one array per member, so the loop over a shape
+        # reads them contiguously
+        self.position = vec3.field(shape=capacity)
+        self.matrix = mat3.field(shape=capacity)
+        self.scale = vec3.field(shape=capacity)
+        self.repeat = vec3.field(shape=capacity)
+        self.copies = vec3.field(shape=capacity)
+
+    def build(self, types: np.ndarray, indices: list[int]):
+        indices = np.array(indices, np.int32)
+        order = indices[np.argsort(types[indices], kind='stable')]
+
+        counts = np.bincount(types[order], minlength=self.start.shape[0] - 1)
+        start = np.zeros(self.start.shape[0], np.int32)
+        start[1:] = np.cumsum(counts)
+
+        index = np.zeros(self.index.shape[0], np.int32)
+        index[:len(order)] = order
+
+        self.start.from_numpy(start)
+        self.index.from_numpy(index)
+
+    @ti.kernel
+    def gather(self, objects: ti.template()):
+        for k in range(self.start[self.start.shape[0] - 1]):
+            transform = objects[self.index[k]].transform
+            self.position[k] = transform.position
+            self.matrix[k] = transform.matrix
+            self.scale[k] = transform.scale
+            self.repeat[k] = transform.repeat
+            self.copies[k] = transform.copies
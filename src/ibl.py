@@ -1,40 +1,185 @@
 import numpy as np
 import taichi as ti
-from taichi.math import vec2, vec3
+from taichi.math import vec2, vec3, pi, log2, clamp, cos, sqrt
 
 
 from .camera import camera_gamma
+from .config import RAY_CONES, ENV_LEVELS, ENV_SAMPLING
 from .dataclass import Ray
 from .postprocessor import adjust
-from .util import sample_spherical_map
+from .util import sample_spherical_map, spherical_map_direction, brightness, sample_float
 
 
 @ti.data_oriented
 class Image:
-    def __init__(self, path: str):
+    def __init__(self, path: str, levels: int = 1):
         img = ti.tools.imread(path).astype(np.float32)
         self.img = vec3.field(shape=img.shape[:2])
         self.img.from_numpy(img / 255)
 
+        # each level of the mip chain halves the one before
+        self.mips = [self.img]
+        for k in range(1, levels):
+            shape = (img.shape[0] >> k, img.shape[1] >> k)
+            if min(shape) == 0:
+                break
+            self.mips.append(vec3.field(shape=shape))
+
     @ti.kernel
     def process(self, exposure: float, gamma: float):
         for i, j in self.img:
             color = self.img[i, j]
             self.img[i, j] = adjust(color, exposure, gamma)
 
+    def mipmap(self):
+        img = self.img.to_numpy()
+        for mip in self.mips[1:]:
+            w, h = mip.shape
+            img = img[:2 * w, :2 * h].reshape(w, 2, h, 2, 3).mean(axis=(1, 3))
+            mip.from_numpy(img)
+
     @ti.func
     def texture(self, uv: vec2) -> vec3:
         x = int(uv.x * self.img.shape[0])
         y = int(uv.y * self.img.shape[1])
         return self.img[x, y]
 
+    @ti.func
+    def texture_lod(self, uv: vec2, lod: float) -> vec3:
+        # blend the two levels around lod
+        lod = clamp(lod, 0.0, len(self.mips) - 1.0)
+        lower = int(lod)
+        color = vec3(0)
+        for k in ti.static(range(len(self.mips))):
+            if k == lower or k == lower + 1:
+                x = int(uv.x * self.mips[k].shape[0])
+                y = int(uv.y * self.mips[k].shape[1])
+                color += (1.0 - abs(lod - k)) * self.mips[k][x, y]
+        return color
+
+
+@ti.data_oriented
+class AliasTables:
+    def __init__(self, image: Image):
+        # texels weighted by how much light they give, times the cos of
+        # their latitude, the solid angle a texel covers at it, see
+        # Pharr et al., Physically Based Rendering, 13.6.7 and 14.2.4
+        self.image = image
+        w, h = image.img.shape
+        self.size = w * h + h  # a table over each row, then one over the rows
+
+        img = image.img.to_numpy()
+        lat = ((np.arange(h) + 0.5) / h - 0.5) * np.pi
+        weight = img @ np.array([0.299, 0.587, 0.114]) * np.cos(lat)
+
+        rows = weight.sum(0)
+        empty = rows <= 0.0  # never picked, but its table must be valid
+        weight[:, empty], rows[empty] = 1.0, 0.0
+        scaled = np.concatenate([(weight * w / weight.sum(0)).T.ravel(),
+                                 rows * h / rows.sum()]).astype(np.float32)
+
+        self.prob = ti.field(dtype=ti.f32, shape=self.size)
+        self.alias = ti.field(dtype=ti.i32, shape=self.size)
+        self.work = ti.field(dtype=ti.i32, shape=self.size)
+        self.prob.from_numpy(scaled)
+        self.tabulate()
+
+        # solid angle density of a texel over its brightness
+        self.scale = ti.field(dtype=ti.f32, shape=())
+        self.scale[None] = w * h / (2.0 * np.pi * np.pi * rows.sum())
+
+    @ti.func
+    def build(self, offset: int, n: int):
+        # Vose's alias method over the weights at offset, which average 1,
+        # small ones stack up from the front of work and large ones from
+        # the back, so one table needs no more room than itself
+        small, large = offset, offset + n
+        for k in range(offset, offset + n):
+            self.alias[k] = k - offset
+            if self.prob[k] < 1.0:
+                self.work[small] = k
+                small += 1
+            else:
+                large -= 1
+                self.work[large] = k
+
+        while small > offset and large < offset + n:
+            small -= 1
+            s, g = self.work[small], self.work[large]
+            self.alias[s] = g - offset
+            self.prob[g] -= 1.0 - self.prob[s]
+            if self.prob[g] < 1.0:
+                large += 1
+                self.work[small] = g
+                small += 1
+
+        # what is left is 1 up to rounding
+        for k in range(offset, small):
+            self.prob[self.work[k]] = 1.0
+        for k in range(large, offset + n):
+            self.prob[self.work[k]] = 1.0
+
+    @ti.kernel
+    def tabulate(self):
+        w, h = self.image.img.shape
+        for y in range(h):
+            self.build(y * w, w)
+        for _ in range(1):
+            self.build(w * h, h)
+
+    @ti.func
+    def pick(self, offset: int, n: int) -> int:
+        k = min(int(sample_float() * n), n - 1)
+        return k if sample_float() < self.prob[offset + k] else self.alias[offset + k]
+
+    @ti.func
+    def sample(self) -> vec3:
+        # a row by its share of the light, a texel in it by its share of
+        # the row, then a point in the texel
+        w, h = self.image.img.shape
+        y = self.pick(w * h, h)
+        x = self.pick(y * w, w)
+        uv = (vec2(x, y) + vec2(sample_float(), sample_float())) / vec2(w, h)
+        return spherical_map_direction(uv)
+
+    @ti.func
+    def pdf(self, direction: vec3) -> float:
+        # the texel was weighted by the cos of the latitude at its center
+        h = self.image.img.shape[1]
+        uv = sample_spherical_map(direction)
+        center = ((int(uv.y * h) + 0.5) / h - 0.5) * pi
+        ratio = cos(center) / max(sqrt(1.0 - direction.y * direction.y), 1e-8)
+        return brightness(self.image.texture(uv)) * ratio * self.scale[None]
+
 
-hdr_map = Image('assets/Tokyo_BigSight_3k.hdr')
+hdr_map = Image('assets/Tokyo_BigSight_3k.hdr', ENV_LEVELS if RAY_CONES else 1)
 hdr_map.process(exposure=1.4, gamma=camera_gamma)
+if RAY_CONES:
+    hdr_map.mipmap()
+
+env_tables = AliasTables(hdr_map) if ENV_SAMPLING else None
 
 
 @ti.func
 def sky_color(ray: Ray) -> vec3:
     uv = sample_spherical_map(ray.direction)
-    color = hdr_map.texture(uv)
+    color = vec3(0)
+    if ti.static(RAY_CONES):
+        # the level whose texels are as wide as the cone
+        texel = 2.0 * pi / hdr_map.img.shape[0]
+        color = hdr_map.texture_lod(uv, log2(ray.spread / texel))
+    else:
+        color = hdr_map.texture(uv)
     return color
+
+
+@ti.func
+def sample_env() -> vec3:
+    # a direction towards the sky, drawn as often as it is bright
+    return env_tables.sample()
+
+
+@ti.func
+def env_pdf(direction: vec3) -> float:
+    # of sample_env() drawing the direction, by solid angle
+    return env_tables.pdf(direction)
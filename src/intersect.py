@@ -0,0 +1,138 @@
+import taichi as ti
+from taichi.math import vec2, vec3, length, dot, sqrt, min, max
+
+
+from .config import MAX_DIS
+from .sdf import SHAPE, BOX_ROUNDING, sd_box
+
+
+# from https://iquilezles.org/articles/intersectors/
+# each returns the nearest t >= 0 in local space, or MAX_DIS on a miss
+
+
+@ti.func
+def nearest_root(interval: vec2) -> float:
+    t = MAX_DIS
+    if interval.x <= interval.y:
+        # leave the solid if the ray starts inside it
+        t = interval.x if interval.x >= 0 else interval.y
+    return t if t >= 0 else MAX_DIS
+
+
+@ti.func
+def it_sphere(ro: vec3, rd: vec3, r: vec3) -> float:
+    b = dot(ro, rd)
+    qc = ro - b * rd  # more robust than b * b - c for large spheres
+    h = r.x * r.x - dot(qc, qc)
+
+    t = MAX_DIS
+    if h >= 0:
+        h = sqrt(h)
+        t = nearest_root(vec2(-b - h, -b + h))
+    return t
+
+
+@ti.func
+def rounded_box_entry(ro: vec3, rd: vec3, size: vec3, rad: float) -> float:
+    m = 1.0 / ti.select(abs(rd) < 1e-8, 1e-8, rd)
+    n = m * ro
+    k = abs(m) * (size + rad)
+
+    tN = (-n - k).max()
+    tF = (-n + k).min()
+
+    t = MAX_DIS
+    if tN <= tF and tF >= 0:
+        t = max(tN, 0)
+
+        # convert to first octant
+        s = ti.select(ro + t * rd < 0, -1.0, 1.0)
+        ro *= s
+        rd *= s
+        pos = ro + t * rd - size
+        pos = max(pos, pos.yzx)
+
+        # the bounding box is hit outside of the faces
+        if pos.min() >= 0:
+            oc = ro - size
+            dd = rd * rd
+            oo = oc * oc
+            od = oc * rd
+            ra2 = rad * rad
+
+            t = MAX_DIS
+
+            # corner
+            b = od.x + od.y + od.z
+            c = oo.x + oo.y + oo.z - ra2
+            h = b * b - c
+            if h > 0:
+                h = -b - sqrt(h)
+                if h > 0:
+                    t = h
+
+            # edges
+            for i in ti.static(range(3)):
+                j, l = ti.static((i + 1) % 3, (i + 2) % 3)
+                a = dd[j] + dd[l]
+                b = od[j] + od[l]
+                c = oo[j] + oo[l] - ra2
+                h = b * b - a * c
+                if h > 0:
+                    h = (-b - sqrt(h)) / a
+                    if h > 0 and h < t and abs(ro[i] + rd[i] * h) < size[i]:
+                        t = h
+
+    return t
+
+
+@ti.func
+def it_box(ro: vec3, rd: vec3, b: vec3) -> float:
+    t = MAX_DIS
+    if sd_box(ro, b) >= 0:
+        t = rounded_box_entry(ro, rd, b, BOX_ROUNDING)
+    else:
+        # the box is convex, so its exit is the entry of the reversed ray
+        # started from anywhere outside
+        far = length(ro) + length(b) + 2.0 * BOX_ROUNDING
+        back = rounded_box_entry(ro + rd * far, -rd, b, BOX_ROUNDING)
+        t = max(far - back, 0) if back < MAX_DIS else MAX_DIS
+    return t
+
+
+@ti.func
+def it_cylinder(ro: vec3, rd: vec3, rh: vec3) -> float:
+    # the capped cylinder is an infinite cylinder cut by a slab
+    a = dot(rd.xz, rd.xz)
+    b = dot(ro.xz, rd.xz)
+    c = dot(ro.xz, ro.xz) - rh.x * rh.x
+
+    side = vec2(-MAX_DIS, MAX_DIS)
+    if a > 1e-12:
+        h = b * b - a * c
+        side = vec2(MAX_DIS, -MAX_DIS)
+        if h >= 0:
+            h = sqrt(h)
+            side = vec2(-b - h, -b + h) / a
+    elif c > 0:
+        side = vec2(MAX_DIS, -MAX_DIS)
+
+    inv = 1.0 / ti.select(abs(rd.y) < 1e-8, 1e-8, rd.y)
+    slab = vec2(-rh.y - ro.y, rh.y - ro.y) * inv
+    slab = vec2(slab.min(), slab.max())
+
+    return nearest_root(vec2(max(side.x, slab.x), min(side.y, slab.y)))
+
+
+@ti.func
+def it_plane(ro: vec3, rd: vec3, h: vec3) -> float:
+    t = (h.y - ro.y) / ti.select(abs(rd.y) < 1e-8, 1e-8, rd.y)
+    return t if t >= 0 else MAX_DIS
+
+
+SHAPE_INTERSECT = {
+    SHAPE.SPHERE: it_sphere,
+    SHAPE.BOX: it_box,
+    SHAPE.CYLINDER: it_cylinder,
+    SHAPE.PLANE: it_plane,
+}
@@ -0,0 +1,134 @@
+import numpy as np
+import taichi as ti
+from taichi.math import vec3, pi, dot, sin, cos
+
+
+from .sdf import SHAPE, BOX_ROUNDING
+from .util import random_in_unit_sphere, random_in_unit_disk, sample_float
+
+
+# points on the surfaces of emitters, in the local frame of the object,
+# each returns (point, outward normal) and only draws from the part of
+# the surface that may face x, whose area does not depend on x
+
+
+@ti.func
+def ar_sphere(r: vec3) -> float:
+    return 2.0 * pi * r.x * r.x
+
+
+@ti.func
+def ar_box(b: vec3) -> float:
+    b += BOX_ROUNDING
+    return 4.0 * (b.y * b.z + b.x * b.z + b.x * b.y)
+
+
+@ti.func
+def ar_cylinder(rh: vec3) -> float:
+    return pi * rh.x * rh.x + 4.0 * pi * rh.x * rh.y
+
+
+@ti.func
+def ss_sphere(x: vec3, r: vec3) -> tuple[vec3, vec3]:
+    n = random_in_unit_sphere()
+    n *= 1.0 if dot(n, x) >= 0 else -1.0  # the hemisphere towards x
+    return n * r.x, n
+
+
+@ti.func
+def ss_box(x: vec3, b: vec3) -> tuple[vec3, vec3]:
+    b += BOX_ROUNDING
+    faces = 4.0 * vec3(b.y * b.z, b.x * b.z, b.x * b.y)  # one face per axis
+
+    # the face of the axis picked by area, on the side of x
+    u = sample_float() * faces.sum()
+    axis = 0 if u < faces.x else (1 if u < faces.x + faces.y else 2)
+    side = 1.0 if x[axis] >= 0 else -1.0
+
+    p = (2.0 * vec3(sample_float(), sample_float(), sample_float()) - 1.0) * b
+    n = vec3(0)
+    p[axis], n[axis] = side * b[axis], side
+    return p, n
+
+
+@ti.func
+def ss_cylinder(x: vec3, rh: vec3) -> tuple[vec3, vec3]:
+    cap = pi * rh.x * rh.x
+    wall = 4.0 * pi * rh.x * rh.y
+    side = 1.0 if x.y >= 0 else -1.0  # the other cap can not face x
+
+    p, n = vec3(0), vec3(0)
+    if sample_float() * (cap + wall) < cap:
+        d = random_in_unit_disk() * rh.x
+        p, n = vec3(d.x, side * rh.y, d.y), vec3(0, side, 0)
+    else:
+        a = 2.0 * pi * sample_float()
+        n = vec3(cos(a), 0, sin(a))
+        p = vec3(n.x * rh.x, (2.0 * sample_float() - 1.0) * rh.y, n.z * rh.x)
+    return p, n
+
+
+SHAPE_SAMPLE = {
+    SHAPE.SPHERE: ss_sphere,
+    SHAPE.BOX: ss_box,
+    SHAPE.CYLINDER: ss_cylinder,
+}
+
+SHAPE_AREA = {
+    SHAPE.SPHERE: ar_sphere,
+    SHAPE.BOX: ar_box,
+    SHAPE.CYLINDER: ar_cylinder,
+}
+
+
+@ti.data_oriented
+class Lights:
+    def __init__(self, capacity: int):
+        self.indices = ti.field(dtype=ti.i32, shape=capacity)
+        self.count = ti.field(dtype=ti.i32, shape=())
+        self.sampled = ti.field(dtype=ti.i32, shape=capacity)  # 1 for each light
+
+    def build(self, objects, count: int):
+        # emitters brighten what hits them, unrepeated ones of a shape
+        # with a surface to sample are lights
+        types = objects.type.to_numpy()[:count]
+        emission = objects.material.emission.to_numpy()[:count]
+        repeats = objects.transform.repeat.to_numpy()[:count]
+
+        bright = emission @ np.array([0.299, 0.587, 0.114]) > 1.0
+        samplable = np.isin(types, list(SHAPE_SAMPLE)) & ~repeats.any(1)
+        indices = np.flatnonzero(bright & samplable).astype(np.int32)
+
+        data = np.zeros(self.indices.shape[0], np.int32)
+        data[:len(indices)] = indices
+        self.indices.from_numpy(data)
+        self.count[None] = len(indices)
+
+        data = np.zeros(self.sampled.shape[0], np.int32)
+        data[indices] = 1
+        self.sampled.from_numpy(data)
+
+    @ti.func
+    def density(self, objects: ti.template(), i: int) -> float:
+        # of a point on light i facing the bounce it was sampled from, by area
+        area = 1.0
+        for shape in ti.static(SHAPE_AREA):
+            if objects[i].type == shape:
+                area = SHAPE_AREA[shape](objects[i].transform.scale)
+        return 1.0 / (self.count[None] * area)
+
+    @ti.func
+    def sample(self, objects: ti.template(), x: vec3) -> tuple[int, vec3, vec3, float]:
+        # a light picked uniformly, then a point on its surface, and the
+        # density of that point by area
+        k = min(int(sample_float() * self.count[None]), self.count[None] - 1)
+        i = self.indices[k]
+        t = objects[i].transform
+
+        p, n = vec3(0), vec3(0, 1, 0)
+        for shape in ti.static(SHAPE_SAMPLE):
+            if objects[i].type == shape:
+                p, n = SHAPE_SAMPLE[shape](t.matrix @ (x - t.position), t.scale)
+
+        inverse = t.matrix.transpose()  # rotation only
+        return i, t.position + inverse @ p, inverse @ n, self.density(objects, i)
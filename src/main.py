@@ -4,10 +4,10 @@ from taichi.math import vec2
 from taichi.ui import LEFT, RIGHT, UP, DOWN, RELEASE
 
 
-from .config import image_resolution
+from .config import image_resolution, MARCH_STATS
 from .fileds import image_pixels, diff_pixels, ray_buffer
 from .camera import smooth, camera_exposure,  camera_focus, camera_aperture, camera_vfov
-from .scene import build_scene
+from .scene import build_scene, exhausted_rays
 from .renderer import render
 
 
@@ -20,6 +20,7 @@ smooth.init(camera)
 
 build_scene()
 prev_time = time.time()
+stats_time = prev_time
 
 while window.running:
     curr_time = time.time()
@@ -61,6 +62,11 @@ while window.running:
 
     render(refreshing)
 
+    if MARCH_STATS and curr_time - stats_time > 1.0:
+        print('exhausted rays per second', exhausted_rays[None] / (curr_time - stats_time))
+        exhausted_rays[None] = 0
+        stats_time = curr_time
+
     canvas.set_image(image_pixels)
     # canvas.set_image((diff_pixels.to_numpy() > 1e-3).astype('float32'))
     # canvas.set_image(((ray_buffer.depth).to_numpy() / 3.0).astype('float32'))
@@ -0,0 +1,362 @@
+import os
+import hashlib
+import numpy as np
+import taichi as ti
+from taichi.math import vec3, vec4, ivec3, length, floor, clamp, mix, normalize
+
+
+from .config import MESH_CAPACITY, MESH_RESOLUTION, MESH_BRICK, MESH_BRICKS, MESH_CACHE
+from .dataclass import Dual
+
+
+# triangle meshes baked into sparse distance grids over [-1, 1]^3,
+# the mesh is centered and scaled to fit inside MESH_FIT of that cube
+#   bricks      MESH_BRICK cells per edge, with samples at the corners
+#   index       the brick of each block of cells, -1 where it is empty
+#   coarse      a lower bound of the distance inside each empty block
+# bakes are cached as .npy files keyed by the mesh and the resolution,
+# so loading a mesh again is a memory-mapped read
+
+MESH_FIT = 0.9
+
+
+def read_obj(path: str) -> tuple[np.ndarray, np.ndarray]:
+    vertices, faces = [], []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == 'v':
+                vertices.append([float(x) for x in words[1:4]])
+            elif words[0] == 'f':
+                # a polygon is a fan of triangles, indices start at 1
+                # and count back from the end when negative
+                polygon = [int(w.split('/')[0]) for w in words[1:]]
+                polygon = [k - 1 if k > 0 else len(vertices) + k for k in polygon]
+                for k in range(1, len(polygon) - 1):
+                    faces.append([polygon[0], polygon[k], polygon[k + 1]])
+
+    return np.array(vertices, np.float64), np.array(faces, np.int64).reshape(-1, 3)
+
+
+PLY_TYPES = {'char': 'i1', 'uchar': 'u1', 'short': 'i2', 'ushort': 'u2', 'int': 'i4',
+             'uint': 'u4', 'float': 'f4', 'double': 'f8', 'int8': 'i1', 'uint8': 'u1',
+             'int16': 'i2', 'uint16': 'u2', 'int32': 'i4', 'uint32': 'u4',
+             'float32': 'f4', 'float64': 'f8'}
+
+
+def read_ply(path: str) -> tuple[np.ndarray, np.ndarray]:
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    end = data.index(b'end_header') + len(b'end_header')
+    end = data.index(b'\n', end) + 1
+    header = data[:end].decode('ascii').split('\n')
+    body = data[end:]
+
+    form, elements = 'ascii', []
+    for line in header:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == 'format':
+            form = words[1]
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property':
+            elements[-1][2].append(words[1:])
+
+    vertices, faces = None, []
+    if form == 'ascii':
+        lines = iter(body.decode('ascii').split('\n'))
+        for name, count, properties in elements:
+            names = [p[-1] for p in properties]
+            rows = [next(lines).split() for _ in range(count)]
+            if name == 'vertex':
+                columns = [names.index(axis) for axis in 'xyz']
+                vertices = np.array([[float(r[c]) for c in columns] for r in rows])
+            elif name == 'face':
+                for r in rows:
+                    polygon = [int(k) for k in r[1:1 + int(r[0])]]
+                    for k in range(1, len(polygon) - 1):
+                        faces.append([polygon[0], polygon[k], polygon[k + 1]])
+    else:
+        order = '<' if form == 'binary_little_endian' else '>'
+        offset = 0
+        for name, count, properties in elements:
+            if properties[0][0] == 'list':
+                _, size, kind, _ = properties[0]
+                size, kind = np.dtype(order + PLY_TYPES[size]), np.dtype(order + PLY_TYPES[kind])
+                for _ in range(count):
+                    n = int(np.frombuffer(body, size, 1, offset)[0])
+                    polygon = np.frombuffer(body, kind, n, offset + size.itemsize)
+                    offset += size.itemsize + n * kind.itemsize
+                    if name == 'face':
+                        for k in range(1, n - 1):
+                            faces.append([polygon[0], polygon[k], polygon[k + 1]])
+            else:
+                dtype = np.dtype([(p[-1], order + PLY_TYPES[p[0]]) for p in properties])
+                rows = np.frombuffer(body, dtype, count, offset)
+                offset += count * dtype.itemsize
+                if name == 'vertex':
+                    vertices = np.stack([rows[axis] for axis in 'xyz'], axis=1)
+
+    return np.asarray(vertices, np.float64), np.array(faces, np.int64).reshape(-1, 3)
+
+
+def read_mesh(path: str) -> tuple[np.ndarray, np.ndarray]:
+    if path.lower().endswith('.obj'):
+        return read_obj(path)
+    if path.lower().endswith('.ply'):
+        return read_ply(path)
+    raise ValueError(f'{path} is neither an .obj nor a .ply mesh')
+
+
+def closest_on_triangle(p: np.ndarray, a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    # the closest point of one triangle to each of p, by the region of the
+    # triangle p projects into, see Ericson, Real-Time Collision Detection
+    ab, ac, ap = b - a, c - a, p - a
+    d1, d2 = ap @ ab, ap @ ac
+    bp = p - b
+    d3, d4 = bp @ ab, bp @ ac
+    cp = p - c
+    d5, d6 = cp @ ab, cp @ ac
+
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+    area = np.maximum(va + vb + vc, 1e-30)
+    v, w = vb / area, vc / area
+    q = a + v[:, None] * ab + w[:, None] * ac  # inside the face
+
+    def edge(mask, start, direction, t):
+        q[mask] = start + np.clip(t[mask], 0, 1)[:, None] * direction
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        edge((vc <= 0) & (d1 >= 0) & (d3 <= 0), a, ab, d1 / (d1 - d3))
+        edge((vb <= 0) & (d2 >= 0) & (d6 <= 0), a, ac, d2 / (d2 - d6))
+        edge((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0), b, c - b,
+             (d4 - d3) / ((d4 - d3) + (d5 - d6)))
+    q[(d1 <= 0) & (d2 <= 0)] = a
+    q[(d3 >= 0) & (d4 <= d3)] = b
+    q[(d6 >= 0) & (d5 <= d6)] = c
+    return q
+
+
+def inside_along(triangles: np.ndarray, samples: int, axis: int) -> np.ndarray:
+    # even-odd crossings of rays along the axis, counted from the far end
+    u, v = [k for k in range(3) if k != axis]
+    step = 2.0 / (samples - 1)
+    diff = np.zeros((samples, samples, samples + 1), np.int32)
+
+    for tri in triangles:
+        a, b, c = tri[:, u], tri[:, v], tri[:, axis]
+        lo = np.maximum(np.ceil((np.array([a.min(), b.min()]) + 1) / step), 0).astype(int)
+        hi = np.minimum(np.floor((np.array([a.max(), b.max()]) + 1) / step), samples - 1).astype(int)
+        area = (a[1] - a[0]) * (b[2] - b[0]) - (a[2] - a[0]) * (b[1] - b[0])
+        if (lo > hi).any() or abs(area) < 1e-30:
+            continue
+
+        # rays pass a hair off the lattice, so they miss shared edges
+        i, j = np.meshgrid(np.arange(lo[0], hi[0] + 1), np.arange(lo[1], hi[1] + 1), indexing='ij')
+        x, y = i * step - 1 + 1.3e-7, j * step - 1 + 0.7e-7
+
+        s = ((x - a[0]) * (b[2] - b[0]) - (a[2] - a[0]) * (y - b[0])) / area
+        t = ((a[1] - a[0]) * (y - b[0]) - (x - a[0]) * (b[1] - b[0])) / area
+        hit = (s >= 0) & (t >= 0) & (s + t <= 1)
+        z = c[0] + s * (c[1] - c[0]) + t * (c[2] - c[0])
+
+        # every sample before the crossing sees it ahead
+        k = np.clip(np.ceil((z[hit] + 1) / step), 0, samples).astype(int)
+        np.add.at(diff, (i[hit], j[hit], 0), 1)
+        np.add.at(diff, (i[hit], j[hit], k), -1)
+
+    inside = np.cumsum(diff, axis=2)[..., :samples] % 2 == 1
+    return np.moveaxis(inside, 2, axis)
+
+
+def bake(vertices: np.ndarray, faces: np.ndarray, resolution: int) -> np.ndarray:
+    # signed distances at the (resolution + 1)^3 corners of the cells
+    center = 0.5 * (vertices.min(0) + vertices.max(0))
+    vertices = (vertices - center) * (MESH_FIT / np.abs(vertices - center).max())
+    triangles = vertices[faces]
+
+    samples = resolution + 1
+    step = 2.0 / resolution
+    axis = np.linspace(-1, 1, samples)
+    grid = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1)
+
+    # exact closest points in a narrow band around each triangle
+    closest = np.full(grid.shape, np.inf)
+    best = np.full(grid.shape[:3], np.inf)
+    for a, b, c in triangles:
+        lo = np.maximum(np.floor((np.minimum(np.minimum(a, b), c) + 1) / step) - 1, 0).astype(int)
+        hi = np.minimum(np.ceil((np.maximum(np.maximum(a, b), c) + 1) / step) + 1, resolution).astype(int)
+        box = tuple(slice(l, h + 1) for l, h in zip(lo, hi))
+        p = grid[box].reshape(-1, 3)
+        q = closest_on_triangle(p, a, b, c)
+        d = np.linalg.norm(p - q, axis=1).reshape(best[box].shape)
+        near = d < best[box]
+        best[box] = np.where(near, d, best[box])
+        closest[box] = np.where(near[..., None], q.reshape(closest[box].shape), closest[box])
+
+    # then jump flooding hands each sample the closest point of its
+    # neighbors at halving distances, see Rong and Tan, Jump Flooding in
+    # GPU with Applications to Voronoi Diagram and Distance Transform, 2006
+    offsets = np.stack(np.meshgrid(*[[-1, 0, 1]] * 3, indexing='ij'), -1).reshape(-1, 3)
+    levels = int(np.ceil(np.log2(samples)))
+    for jump in [1 << k for k in reversed(range(levels))] + [1]:  # one more pass of 1
+        for offset in offsets * jump:
+            if not offset.any():
+                continue
+            shifted = np.full(closest.shape, np.inf)
+            src = tuple(slice(max(-o, 0), samples - max(o, 0)) for o in offset)
+            dst = tuple(slice(max(o, 0), samples - max(-o, 0)) for o in offset)
+            shifted[dst] = closest[src]
+            with np.errstate(invalid='ignore'):
+                d = np.linalg.norm(grid - shifted, axis=-1)
+            near = d < best
+            best = np.where(near, d, best)
+            closest = np.where(near[..., None], shifted, closest)
+
+    # a sample is inside where most axes count an odd number of crossings,
+    # which forgives small holes in meshes that are not watertight
+    votes = sum(inside_along(triangles, samples, k).astype(int) for k in range(3))
+    return np.where(votes >= 2, -best, best).astype(np.float32)
+
+
+def bricks_of(values: np.ndarray, brick: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    resolution = values.shape[0] - 1
+    blocks = resolution // brick
+    cell = 2.0 / resolution
+
+    index = np.full((blocks,) * 3, -1, np.int32)
+    coarse = np.zeros((blocks,) * 3, np.float32)
+    bricks = []
+    for I in np.ndindex(*index.shape):
+        box = tuple(slice(k * brick, (k + 1) * brick + 1) for k in I)
+        block = values[box]
+        near = np.abs(block).min()
+
+        # any point of a block is within half a cell diagonal of a sample,
+        # so a block whose samples are all further is empty
+        if near > np.sqrt(3) * cell:
+            coarse[I] = np.sign(block.flat[0]) * (near - 0.5 * np.sqrt(3) * cell)
+        else:
+            index[I] = len(bricks)
+            bricks.append(block)
+
+    bricks = np.array(bricks, np.float32).reshape(-1, *(brick + 1,) * 3)
+    return index, coarse, bricks
+
+
+def cached_bake(path: str, resolution: int, brick: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    with open(path, 'rb') as file:
+        key = hashlib.sha1(file.read() + f'{resolution}/{brick}'.encode()).hexdigest()[:16]
+
+    names = [os.path.join(MESH_CACHE, f'{key}.{part}.npy') for part in ('index', 'coarse', 'bricks')]
+    if not all(os.path.exists(name) for name in names):
+        vertices, faces = read_mesh(path)
+        arrays = bricks_of(bake(vertices, faces, resolution), brick)
+
+        os.makedirs(MESH_CACHE, exist_ok=True)
+        for name, array in zip(names, arrays):
+            np.save(name, array)
+
+    return tuple(np.load(name, mmap_mode='r') for name in names)
+
+
+@ti.data_oriented
+class Meshes:
+    def __init__(self, capacity: int, resolution: int, brick: int, bricks: int):
+        assert resolution % brick == 0, 'the resolution must be a multiple of the brick'
+        self.capacity, self.resolution, self.brick, self.slots = capacity, resolution, brick, bricks
+        self.count, self.used, self.allocated = 0, 0, False
+
+    def allocate(self):
+        # only once a scene compiles the shape in, or loads a mesh,
+        # the bricks are most of the memory
+        if self.allocated:
+            return
+        self.allocated = True
+        blocks, brick = self.resolution // self.brick, self.brick
+
+        self.index = ti.field(dtype=ti.i32, shape=(self.capacity, blocks, blocks, blocks))
+        self.coarse = ti.field(dtype=ti.f32, shape=(self.capacity, blocks, blocks, blocks))
+        self.bricks = ti.field(dtype=ti.f32, shape=(self.slots, brick + 1, brick + 1, brick + 1))
+
+    def load(self, path: str) -> int:
+        self.allocate()
+        if self.count >= self.capacity:
+            raise ValueError(f'no room for more than {self.capacity} meshes')
+
+        index, coarse, bricks = cached_bake(path, self.resolution, self.brick)
+        if self.used + len(bricks) > self.bricks.shape[0]:
+            raise ValueError(f'no room for {len(bricks)} more bricks')
+
+        i = self.count
+        for field, value in ((self.index, np.where(index >= 0, index + self.used, -1)),
+                             (self.coarse, coarse)):
+            data = field.to_numpy()
+            data[i] = value
+            field.from_numpy(data)
+
+        data = self.bricks.to_numpy()
+        data[self.used:self.used + len(bricks)] = bricks
+        self.bricks.from_numpy(data)
+
+        self.count += 1
+        self.used += len(bricks)
+        return i
+
+    @ti.func
+    def sample(self, n: int, p: vec3) -> float:
+        sd = 0.0
+        q = (p + 1.0) * (0.5 * self.resolution)  # in cells
+        if (q < 0).any() or (q > self.resolution).any():
+            # the box is a lower bound, and so is the gap the fit leaves
+            sd = length(max(abs(p) - 1.0, 0.0)) + 1.0 - MESH_FIT
+        else:
+            cell = clamp(ti.cast(floor(q), ti.i32), 0, self.resolution - 1)
+            block = cell // self.brick
+            slot = self.index[n, block.x, block.y, block.z]
+            if slot < 0:
+                sd = self.coarse[n, block.x, block.y, block.z]
+            else:
+                local, f = cell - block * self.brick, q - cell
+                c = ti.Vector.zero(float, 8)
+                for k in ti.static(range(8)):
+                    o = local + ivec3(k & 1, (k >> 1) & 1, k >> 2)
+                    c[k] = self.bricks[slot, o.x, o.y, o.z]
+                x = mix(vec4(c[0], c[2], c[4], c[6]), vec4(c[1], c[3], c[5], c[7]), f.x)
+                y = mix(x.xz, x.yw, f.y)
+                sd = mix(y.x, y.y, f.z)
+        return sd
+
+    @ti.func
+    def gradient(self, n: int, p: vec3) -> Dual:
+        # sample() with the slope of the trilinear blend, outside the
+        # bricks it is only a direction away from the mesh, no hit is there
+        sd = Dual(self.sample(n, p), normalize(p))
+        q = (p + 1.0) * (0.5 * self.resolution)
+        if not ((q < 0).any() or (q > self.resolution).any()):
+            cell = clamp(ti.cast(floor(q), ti.i32), 0, self.resolution - 1)
+            block = cell // self.brick
+            slot = self.index[n, block.x, block.y, block.z]
+            if slot >= 0:
+                local, f = cell - block * self.brick, q - cell
+                c = ti.Vector.zero(float, 8)
+                for k in ti.static(range(8)):
+                    o = local + ivec3(k & 1, (k >> 1) & 1, k >> 2)
+                    c[k] = self.bricks[slot, o.x, o.y, o.z]
+                lo, hi = vec4(c[0], c[2], c[4], c[6]), vec4(c[1], c[3], c[5], c[7])
+                x, dx = mix(lo, hi, f.x), hi - lo
+                y, dy = mix(x.xz, x.yw, f.y), x.yw - x.xz
+                gx = mix(dx.xz, dx.yw, f.y)
+                slope = vec3(mix(gx.x, gx.y, f.z), mix(dy.x, dy.y, f.z), y.y - y.x)
+                sd.grad = slope * (0.5 * self.resolution)
+        return sd
+
+
+meshes = Meshes(MESH_CAPACITY, MESH_RESOLUTION, MESH_BRICK, MESH_BRICKS)
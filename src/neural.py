@@ -0,0 +1,183 @@
+import numpy as np
+import taichi as ti
+from taichi.math import vec3, length, dot, sin, cos, normalize
+
+
+from .config import NEURAL_CAPACITY, NEURAL_WIDTH, NEURAL_DEPTH
+from .dataclass import Dual
+
+
+# sine networks over the unit ball, loaded from an .npz holding
+#   w0, b0      the input layer, (width, 3) and (width,)
+#   w1, b1 ...  hidden layers, (width, width) and (width,)
+#   wN, bN      the output layer, (1, width) and (1,)
+# and optionally
+#   gain        scales each hidden layer, 1 by default
+#   residual    adds each hidden layer to its input, False by default
+#   radius      of a ball around the shape, its distance stands in outside
+#   lipschitz   bound of the network, distances are divided by it
+# every network shares the compiled code, only the weights are data
+
+
+def store(field, i: int, value):
+    data = field.to_numpy()
+    data[i] = value
+    field.from_numpy(data)
+
+
+@ti.data_oriented
+class Networks:
+    def __init__(self, capacity: int, width: int, depth: int):
+        assert width % 4 == 0, 'the width must be a multiple of 4'
+        self.capacity, self.width, self.depth = capacity, width, depth
+        self.count, self.allocated = 0, False
+
+    def allocate(self):
+        # only once a scene compiles the shape in, or loads a network
+        if self.allocated:
+            return
+        self.allocated = True
+        capacity, width, depth = self.capacity, self.width, self.depth
+
+        # units are grouped by 4, so each input adds a scaled column
+        # to a group at once instead of summing up dot products
+        self.inputs = ti.Vector.field(4, float, shape=(capacity, width // 4, 4))  # x, y, z, bias
+        self.weights = ti.Vector.field(4, float, shape=(capacity, depth, width // 4, width))
+        self.biases = ti.Vector.field(4, float, shape=(capacity, depth, width // 4))
+        self.gains = ti.field(float, shape=(capacity, depth))
+        self.skips = ti.field(float, shape=(capacity, depth))
+        self.outputs = ti.Vector.field(4, float, shape=(capacity, width // 4))
+        self.offsets = ti.field(float, shape=capacity)
+
+        self.layers = ti.field(int, shape=capacity)
+        self.radius = ti.field(float, shape=capacity)
+        self.lipschitz = ti.field(float, shape=capacity)
+
+    def load(self, path: str) -> int:
+        self.allocate()
+        data = np.load(path)
+        n = sum(1 for key in data.files if key.startswith('w'))
+        ws = [np.asarray(data[f'w{k}'], np.float32) for k in range(n)]
+        bs = [np.asarray(data[f'b{k}'], np.float32).reshape(-1) for k in range(n)]
+        hidden = n - 2
+
+        if self.count >= self.capacity:
+            raise ValueError(f'no room for more than {self.capacity} networks')
+        if hidden > self.depth:
+            raise ValueError(f'{hidden} hidden layers exceed the depth of {self.depth}')
+        if max(w.shape[0] for w in ws[:-1]) > self.width:
+            raise ValueError(f'layers wider than {self.width} are not supported')
+
+        w, d = self.width, self.depth
+        inputs = np.zeros((4, w), np.float32)
+        inputs[:3, :len(bs[0])], inputs[3, :len(bs[0])] = ws[0].T, bs[0]
+
+        weights = np.zeros((d, w, w), np.float32)
+        biases = np.zeros((d, w), np.float32)
+        for k in range(hidden):
+            rows, cols = ws[k + 1].shape
+            weights[k, :rows, :cols], biases[k, :rows] = ws[k + 1], bs[k + 1]
+
+        outputs = np.zeros(w, np.float32)
+        outputs[:ws[-1].shape[1]] = ws[-1].reshape(-1)
+
+        gains = np.ones(d, np.float32)
+        skips = np.zeros(d, np.float32)
+        gains[:hidden] = data['gain'] if 'gain' in data.files else 1.0
+        skips[:hidden] = data['residual'] if 'residual' in data.files else 0.0
+
+        i, chunks = self.count, (w // 4, 4)
+        store(self.inputs, i, inputs.reshape(4, *chunks).transpose(1, 0, 2))
+        store(self.weights, i, weights.reshape(d, *chunks, w).transpose(0, 1, 3, 2))
+        store(self.biases, i, biases.reshape(d, *chunks))
+        store(self.gains, i, gains)
+        store(self.skips, i, skips)
+        store(self.outputs, i, outputs.reshape(chunks))
+        store(self.offsets, i, bs[-1][0])
+        store(self.layers, i, hidden)
+        store(self.radius, i, data['radius'] if 'radius' in data.files else 1.0)
+        store(self.lipschitz, i, data['lipschitz'] if 'lipschitz' in data.files else 1.0)
+
+        self.count += 1
+        return i
+
+    @ti.func
+    def evaluate(self, n: int, p: vec3) -> float:
+        sd = 0.0
+        if length(p) > 1.0:
+            sd = length(p) - self.radius[n]  # the network is undefined out there
+        else:
+            h = ti.Vector.zero(float, self.width)
+            for k in ti.static(range(self.width // 4)):
+                w = self.inputs[n, k, 0] * p.x + self.inputs[n, k, 1] * p.y
+                y = sin(w + self.inputs[n, k, 2] * p.z + self.inputs[n, k, 3])
+                for j in ti.static(range(4)):
+                    h[4 * k + j] = y[j]
+
+            for l in range(self.layers[n]):
+                z = ti.Vector.zero(float, self.width)
+                for k in ti.static(range(self.width // 4)):
+                    y = self.biases[n, l, k]
+                    for i in ti.static(range(self.width)):
+                        y += h[i] * self.weights[n, l, k, i]
+                    y = sin(y)
+                    for j in ti.static(range(4)):
+                        z[4 * k + j] = y[j]
+                h = z * self.gains[n, l] + h * self.skips[n, l]
+
+            sd = self.offsets[n]
+            for q in ti.static(range(self.width // 4)):
+                sd += dot(self.outputs[n, q], h[4 * q:4 * q + 4])
+
+        return sd
+
+    @ti.func
+    def gradient(self, n: int, p: vec3) -> Dual:
+        # evaluate() with the gradient of every unit carried along
+        sd = Dual(length(p) - self.radius[n], normalize(p))
+        if length(p) <= 1.0:
+            h = ti.Vector.zero(float, self.width)
+            J = ti.Matrix.zero(float, self.width, 3)
+            for k in ti.static(range(self.width // 4)):
+                a, b, c = self.inputs[n, k, 0], self.inputs[n, k, 1], self.inputs[n, k, 2]
+                w = a * p.x + b * p.y + c * p.z + self.inputs[n, k, 3]
+                y, dy = sin(w), cos(w)
+                for j in ti.static(range(4)):
+                    h[4 * k + j] = y[j]
+                    J[4 * k + j, 0] = dy[j] * a[j]
+                    J[4 * k + j, 1] = dy[j] * b[j]
+                    J[4 * k + j, 2] = dy[j] * c[j]
+
+            for l in range(self.layers[n]):
+                z = ti.Vector.zero(float, self.width)
+                D = ti.Matrix.zero(float, self.width, 3)
+                for k in ti.static(range(self.width // 4)):
+                    y = self.biases[n, l, k]
+                    dx, dy, dz = ti.Vector.zero(float, 4), ti.Vector.zero(float, 4), ti.Vector.zero(float, 4)
+                    for i in ti.static(range(self.width)):
+                        w = self.weights[n, l, k, i]
+                        y += h[i] * w
+                        dx += J[i, 0] * w
+                        dy += J[i, 1] * w
+                        dz += J[i, 2] * w
+                    d = cos(y)
+                    y = sin(y)
+                    for j in ti.static(range(4)):
+                        z[4 * k + j] = y[j]
+                        D[4 * k + j, 0] = d[j] * dx[j]
+                        D[4 * k + j, 1] = d[j] * dy[j]
+                        D[4 * k + j, 2] = d[j] * dz[j]
+                h = z * self.gains[n, l] + h * self.skips[n, l]
+                J = D * self.gains[n, l] + J * self.skips[n, l]
+
+            sd = Dual(self.offsets[n], vec3(0))
+            for q in ti.static(range(self.width // 4)):
+                o = self.outputs[n, q]
+                sd.value += dot(o, h[4 * q:4 * q + 4])
+                for j in ti.static(range(4)):
+                    sd.grad += o[j] * vec3(J[4 * q + j, 0], J[4 * q + j, 1], J[4 * q + j, 2])
+
+        return sd
+
+
+networks = Networks(NEURAL_CAPACITY, NEURAL_WIDTH, NEURAL_DEPTH)
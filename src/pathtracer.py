@@ -1,43 +1,148 @@
 import taichi as ti
-from taichi.math import vec2, vec3, vec4
+from taichi.math import (vec2, vec3, vec4, radians, tan, length, dot, pi, acos,
+                         clamp, cross, normalize)
 
 
 from .dataclass import Ray, Camera
-from .fileds import ray_buffer, image_buffer, image_pixels, diff_pixels
+from .fileds import (ray_buffer, image_buffer, image_pixels, diff_pixels, warm_buffer,
+                     warm_slack, warm_camera)
 from .config import (VISIBILITY, QUALITY_PER_SAMPLE, SCREEN_PIXEL_SIZE, ADAPTIVE_SAMPLING,
-                     MAX_RAYTRACE, SAMPLES_PER_PIXEL, NOISE_THRESHOLD, BLACK_BACKGROUND)
+                     MAX_RAYTRACE, SAMPLES_PER_PIXEL, NOISE_THRESHOLD, BLACK_BACKGROUND,
+                     TILE_BINNING, WARM_START, WARM_PIXELS, WARM_RADIUS, LIGHT_SAMPLING, ENV_SAMPLING,
+                     MULTIPLE_IMPORTANCE, MIS_POWER, MAX_DIS)
 from .camera import get_ray, smooth, aspect_ratio, camera_vfov, camera_aperture, camera_focus
 from .util import brightness, sample_float, sample_vec2
-from .pbr import ray_surface_interaction
-from .ibl import sky_color
-from .scene import raycast
+from .pbr import ray_surface_interaction, hemispheric_pdf
+from .ibl import sky_color, sample_env, env_pdf
+from .scene import march, occluded, objects, bvh, tiles, lights, object_count
 
 
 @ti.func
-def raytrace(ray: Ray) -> Ray:
-    ray, object, hit = raycast(ray)
+def mis_weight(pdf: float, other: float) -> float:
+    # of a sample drawn by a strategy with pdf, that another strategy draws
+    # with the other pdf, see Veach and Guibas, Optimally Combining Sampling
+    # Techniques for Monte Carlo Rendering, 1995
+    a, b = pow(pdf, MIS_POWER), pow(other, MIS_POWER)
+    return a / max(a + b, 1e-30)
 
-    if hit:
-        ray = ray_surface_interaction(ray, object)
 
-        intensity = brightness(ray.color)
-        ray.color *= object.material.emission
-        visible = brightness(ray.color)
+@ti.func
+def direct_light(ray: Ray, normal: vec3) -> vec3:
+    # next event estimation, one point on one emitter seen through the
+    # diffuse lobe, whose albedo is already in the color of the ray
+    light = vec3(0)
+    if lights.count[None] > 0:
+        index, point, n, pdf = lights.sample(objects, ray.origin)
+        to = point - ray.origin
+        distance = length(to)
+        wi = to / distance
 
-        stop = intensity < visible or visible < VISIBILITY.x or visible > VISIBILITY.y
-        ray.depth *= -1 if stop else 1
-    else:
-        ray.depth *= -1
-        ray.color *= sky_color(ray)
+        cos_x, cos_y = dot(normal, wi), -dot(n, wi)
+        if cos_x > 0 and cos_y > 0 and not occluded(ray.origin, wi, distance, index):
+            emitter = objects[index].material
+            radiance = emitter.albedo * emitter.emission
+            pdf *= distance * distance / cos_y  # by solid angle
+
+            weight = 1.0
+            if ti.static(MULTIPLE_IMPORTANCE):
+                weight = mis_weight(pdf, hemispheric_pdf(normal, wi))
+            light = ray.color * radiance * weight * cos_x / (pi * pdf)
+
+    return light
+
+
+@ti.func
+def direct_sky(ray: Ray, normal: vec3) -> vec3:
+    # next event estimation of the environment, which is lit from every
+    # direction no object is in the way of
+    wi = sample_env()
+    cos_x = dot(normal, wi)
+
+    light = vec3(0)
+    if cos_x > 0 and not occluded(ray.origin, wi, MAX_DIS, -1):
+        pdf = env_pdf(wi)
+        probe = Ray(ray.origin, wi, ray.color, ray.depth, ray.spread)
 
-        if ti.static(BLACK_BACKGROUND):
-            ray.color *= float(ray.depth < -1)
+        weight = 1.0
+        if ti.static(MULTIPLE_IMPORTANCE):
+            weight = mis_weight(pdf, hemispheric_pdf(normal, wi))
+        light = ray.color * sky_color(probe) * weight * cos_x / (pi * pdf)
+
+    return light
+
+
+@ti.func
+def shade(ray: Ray, index: int, distance: float) -> Ray:
+    # distance is how far the ray went from the bounce before
+    object = objects[index]
+    incoming, pdf = ray.direction, ray.pdf
+    ray, normal, bounce = ray_surface_interaction(ray, object)
+
+    intensity = brightness(ray.color)
+    ray.color *= object.material.emission
+    visible = brightness(ray.color)
+
+    stop = intensity < visible or visible < VISIBILITY.x or visible > VISIBILITY.y
+    ray.depth *= -1 if stop else 1
+
+    if ti.static(LIGHT_SAMPLING):
+        if pdf > 0 and lights.sampled[index]:
+            # the bounce before sampled this light as well
+            weight = 0.0
+            if ti.static(MULTIPLE_IMPORTANCE):
+                cos_y = max(-dot(normal, incoming), 1e-8)
+                other = lights.density(objects, index) * distance * distance / cos_y
+                weight = mis_weight(pdf, other)
+            ray.color *= weight
+
+    ray.pdf = 0.0 if stop else bounce
+    if ti.static(LIGHT_SAMPLING):
+        if ray.pdf > 0:
+            ray.radiance += direct_light(ray, normal)
+
+    if ti.static(ENV_SAMPLING):
+        if ray.pdf > 0:
+            ray.radiance += direct_sky(ray, normal)
 
     return ray
 
 
 @ti.func
-def gen_ray(uv: vec2) -> Ray:
+def escape(ray: Ray) -> Ray:
+    ray.depth *= -1
+    sky = sky_color(ray)
+
+    if ti.static(ENV_SAMPLING):
+        if ray.pdf > 0:
+            # the bounce before sampled the sky as well
+            weight = 0.0
+            if ti.static(MULTIPLE_IMPORTANCE):
+                weight = mis_weight(ray.pdf, env_pdf(ray.direction))
+            sky *= weight
+
+    ray.color *= sky
+
+    if ti.static(BLACK_BACKGROUND):
+        ray.color *= float(ray.depth < -1)
+
+    return ray
+
+
+@ti.func
+def raytrace(ray: Ray, tile: int, start: float, cone: vec2) -> tuple[Ray, float]:
+    origin = ray.origin
+    ray, index, hit, safe = march(ray, tile, start, cone)
+
+    if hit:
+        ray = shade(ray, index, length(ray.origin - origin))
+    else:
+        ray = escape(ray)
+
+    return ray, safe
+
+
+@ti.func
+def current_camera() -> Camera:
     camera = Camera()
     camera.lookfrom = smooth.position[None]
     camera.lookat = smooth.lookat[None]
@@ -47,31 +152,138 @@ def gen_ray(uv: vec2) -> Ray:
     camera.aperture = camera_aperture[None]
     camera.focus = camera_focus[None]
 
-    return get_ray(camera, uv, vec3(1))
+    return camera
+
+
+@ti.func
+def gen_ray(uv: vec2) -> Ray:
+    return get_ray(current_camera(), uv, vec3(1))
+
+
+@ti.func
+def warm_cone(c: Camera) -> vec2:
+    # the lens spreads rays of a pixel until they meet at the focus plane,
+    # and jitter spreads them by a pixel
+    pixel = 2.0 * tan(radians(c.vfov) * 0.5) * SCREEN_PIXEL_SIZE.y
+    lens = c.aperture * 0.5
+    return vec2(lens, lens / c.focus + pixel)
+
+
+@ti.func
+def warm_margin(c: Camera) -> vec2:
+    # how much wider than warm_cone a fresh proof is, to be used up by
+    # moving the camera before the proof must be made again
+    pixel = 2.0 * tan(radians(c.vfov) * 0.5) * SCREEN_PIXEL_SIZE.y
+    return vec2(WARM_RADIUS, (WARM_PIXELS - 1.0) * pixel)
+
+
+@ti.func
+def camera_frame(c: Camera) -> tuple[vec3, vec3, vec3]:
+    # the axes get_ray builds rays from
+    z = normalize(c.lookfrom - c.lookat)
+    x = normalize(cross(c.vup, z))
+    return x, cross(z, x), z
+
+
+@ti.kernel
+def move_warm():
+    # a ray of a pixel is off the ray of the last frame by at most the
+    # lens moving, plus the angle the frame turned by times the distance,
+    # which eats into the margin of the proof, or else into its length
+    c, last = current_camera(), warm_camera[None]
+    x, y, z = camera_frame(c)
+    u, v, w = camera_frame(last)
+    trace = dot(x, u) + dot(y, v) + dot(z, w)  # of the rotation between them
+    turn = acos(clamp(0.5 * (trace - 1.0), -1.0, 1.0))
+    shift = length(c.lookfrom - last.lookfrom) + c.aperture * 0.5 * turn
+    if last.focus <= 0:  # the first frame, nothing is proved yet
+        shift, turn = MAX_DIS, 0.0
+
+    for i, j in warm_buffer:
+        slack = warm_slack[i, j] - vec2(shift, turn)
+        if slack.x < 0:
+            warm_buffer[i, j] = 0.0  # the next march proves it again
+        elif slack.y < 0:
+            # still inside the old tube up to where it narrows to nothing
+            warm_buffer[i, j] = min(warm_buffer[i, j], slack.x / -slack.y)
+            slack = vec2(0)
+        warm_slack[i, j] = slack
+
+    warm_camera[None] = c
+
+
+@ti.kernel
+def bin_objects():
+    tiles.bin(bvh.boxes, object_count[None], current_camera())
+
+
+@ti.func
+def finished(ray: Ray) -> bool:
+    return ray.depth < 1 or ray.depth > MAX_RAYTRACE
+
+
+@ti.func
+def restart(ray: Ray, i: int, j: int) -> Ray:
+    image_buffer[i, j] += vec4(ray.color + ray.radiance, 1.0)
+
+    coord = vec2(i, j) + sample_vec2()
+    uv = coord * SCREEN_PIXEL_SIZE
+    return gen_ray(uv)
+
+
+@ti.func
+def primary_hints(i: int, j: int) -> tuple[int, float, vec2]:
+    tile, start, cone = -1, 0.0, vec2(0)
+
+    if ti.static(TILE_BINNING):
+        tile = tiles.locate(i, j)
+
+    if ti.static(WARM_START):
+        c = current_camera()
+        start = warm_buffer[i, j]
+        if start <= 0:
+            warm_slack[i, j] = warm_margin(c)  # a fresh proof
+        cone = warm_cone(c) + warm_slack[i, j]
+
+    return tile, start, cone
 
 
 @ti.func
 def track_once(ray: Ray, i: int, j: int) -> Ray:
-    if ray.depth < 1 or ray.depth > MAX_RAYTRACE:
-        image_buffer[i, j] += vec4(ray.color, 1.0)
+    tile, start, cone = -1, 0.0, vec2(0)
+    primary = finished(ray)
+    if primary:
+        ray = restart(ray, i, j)
+        tile, start, cone = primary_hints(i, j)
+
+    ray, safe = raytrace(ray, tile, start, cone)
 
-        coord = vec2(i, j) + sample_vec2()
-        uv = coord * SCREEN_PIXEL_SIZE
-        ray = gen_ray(uv)
+    if ti.static(WARM_START):
+        if primary:
+            warm_buffer[i, j] = safe
 
-    return raytrace(ray)
+    return ray
 
 
 @ti.func
-def russian_roulette(ray: Ray, i: int, j: int) -> Ray:
+def roulette(ray: Ray) -> tuple[Ray, bool]:
     roulette_prob = 1.0 if ray.depth == 0 else QUALITY_PER_SAMPLE
     roulette_prob -= ray.depth * ti.static(1.0 / MAX_RAYTRACE)
 
-    if sample_float() > roulette_prob:
+    survived = sample_float() <= roulette_prob
+    if not survived:
         ray.color = vec3(0)
         ray.depth *= -1
     else:
         ray.color *= 1.0 / roulette_prob
+
+    return ray, survived
+
+
+@ti.func
+def russian_roulette(ray: Ray, i: int, j: int) -> Ray:
+    ray, survived = roulette(ray)
+    if survived:
         ray = track_once(ray, i, j)
 
     return ray
@@ -95,7 +307,7 @@ def sample(i: int, j: int):
 def pathtrace():
     for i, j in image_pixels:
         if ti.static(ADAPTIVE_SAMPLING):
-            # ToDo: Shader Execution Reordering
+            # reordering needs the stages of wavefront.py
             diff = diff_pixels[i, j]  # for self-adaptive sampling
             if diff > NOISE_THRESHOLD:
                 sample(i, j)
@@ -1,9 +1,10 @@
 import taichi as ti
-from taichi.math import vec3, mix, sqrt, normalize, dot
+from taichi.math import vec3, mix, sqrt, normalize, dot, pi
+from enum import IntEnum
 
 
-from .config import ENV_IOR, MIN_DIS
-from .dataclass import Ray, SDFObject
+from .config import ENV_IOR, MIN_DIS, RAY_CONES
+from .dataclass import Ray, SDFObject, Material
 from .util import random_in_unit_sphere, sample_float
 from .scene import calc_normal
 
@@ -20,7 +21,31 @@ def hemispheric_sampling(normal: vec3) -> vec3:
 
 
 @ti.func
-def ray_surface_interaction(ray: Ray, object: SDFObject) -> Ray:
+def hemispheric_pdf(normal: vec3, direction: vec3) -> float:
+    # a unit vector added to the normal falls by the cosine of the normal
+    return max(dot(normal, direction), 0.0) / pi
+
+
+class LOBE(IntEnum):
+    REFLECTIVE = 0
+    TRANSMISSIVE = 1
+    DIFFUSE = 2
+
+
+@ti.func
+def dominant_lobe(material: Material) -> int:
+    # the branch below a hit most likely takes, the Fresnel term is small
+    # away from grazing angles
+    lobe = LOBE.DIFFUSE
+    if material.metallic >= 0.5:
+        lobe = LOBE.REFLECTIVE
+    elif material.transmission >= 0.5:
+        lobe = LOBE.TRANSMISSIVE
+    return lobe
+
+
+@ti.func
+def ray_surface_interaction(ray: Ray, object: SDFObject) -> tuple[Ray, vec3, float]:
     albedo = object.material.albedo
     roughness = object.material.roughness
     metallic = object.material.metallic
@@ -44,7 +69,11 @@ def ray_surface_interaction(ray: Ray, object: SDFObject) -> Ray:
     F0 = 2.0 * (eta - 1.0) / (eta + 1.0)
     F = fresnel_schlick(NoI, F0*F0)
 
+    # the cone widens by about the angle of the lobe it is sampled from
+    lobe = alpha
+
     # ToDo: Removing if statements?
+    pdf = 0.0  # mirrors and refraction are not drawn from a density
     if sample_float() < F + metallic or k < 0.0:
         ray.direction = I - 2.0 * NoI * N
         outer = dot(ray.direction, normal) < 0.0
@@ -53,10 +82,17 @@ def ray_surface_interaction(ray: Ray, object: SDFObject) -> Ray:
         ray.direction = eta * I - (sqrt(k) + eta * NoI) * N
     else:
         ray.direction = hemispheric_sample
+        pdf = hemispheric_pdf(normal, ray.direction)
+        lobe = 1.0
+
+    if ti.static(RAY_CONES):
+        ray.spread += lobe
 
     ray.color *= albedo
 
     outer = dot(ray.direction, normal) < 0.0
     ray.origin += normal * MIN_DIS * (-1.0 if outer else 1.0)
 
-    return ray
+    # the normal on the side the ray came from, and the density of the
+    # direction given the branch taken
+    return ray, normal, pdf
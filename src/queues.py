@@ -0,0 +1,78 @@
+import taichi as ti
+
+
+@ti.data_oriented
+class Queue:
+    def __init__(self, capacity: int, block: int = 256, keys: int = 1):
+        self.block, self.keys = block, keys
+        self.items = ti.field(dtype=ti.i32, shape=capacity)
+        self.size = ti.field(dtype=ti.i32, shape=())
+        self.sums = ti.field(dtype=ti.i32, shape=(capacity + block - 1) // block)
+
+        # for sorting by keys below the given count
+        self.counts = ti.field(dtype=ti.i32, shape=(self.sums.shape[0], keys))
+        self.bases = ti.field(dtype=ti.i32, shape=keys)
+        self.spare = ti.field(dtype=ti.i32, shape=capacity)
+        self.total = ti.field(dtype=ti.i32, shape=())
+
+    @ti.kernel
+    def select(self, labels: ti.template(), label: int):
+        # a stable stream compaction of the paths with the label, by an
+        # exclusive prefix sum over the counts of blocks of paths
+        for b in range(self.sums.shape[0]):
+            count = 0
+            for k in range(b * self.block, min((b + 1) * self.block, labels.shape[0])):
+                count += int(labels[k] == label)
+            self.sums[b] = count
+
+        self.size[None] = 0
+        ti.loop_config(serialize=True)
+        for b in range(self.sums.shape[0]):
+            count = self.sums[b]
+            self.sums[b] = self.size[None]
+            self.size[None] += count
+
+        for b in range(self.sums.shape[0]):
+            offset = self.sums[b]
+            for k in range(b * self.block, min((b + 1) * self.block, labels.shape[0])):
+                if labels[k] == label:
+                    self.items[offset] = k
+                    offset += 1
+
+    @ti.kernel
+    def sort(self, keys: ti.template()):
+        # a stable counting sort of the queue by the key of each path, with
+        # the count of every key in every block scanned block by block for
+        # all keys at once, and only the totals of the keys scanned in turn
+        blocks = (self.size[None] + self.block - 1) // self.block
+        for b, key in ti.ndrange(blocks, self.keys):
+            self.counts[b, key] = 0
+
+        for b in range(blocks):
+            for k in range(b * self.block, min((b + 1) * self.block, self.size[None])):
+                self.counts[b, keys[self.items[k]]] += 1
+
+        for key in range(self.keys):
+            offset = 0
+            for b in range(blocks):
+                count = self.counts[b, key]
+                self.counts[b, key] = offset
+                offset += count
+            self.bases[key] = offset
+
+        self.total[None] = 0
+        ti.loop_config(serialize=True)
+        for key in range(self.keys):
+            count = self.bases[key]
+            self.bases[key] = self.total[None]
+            self.total[None] += count
+
+        for b in range(blocks):
+            for k in range(b * self.block, min((b + 1) * self.block, self.size[None])):
+                path = self.items[k]
+                key = keys[path]
+                self.spare[self.bases[key] + self.counts[b, key]] = path
+                self.counts[b, key] += 1
+
+        for k in range(self.size[None]):
+            self.items[k] = self.spare[k]
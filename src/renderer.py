@@ -2,11 +2,13 @@ import taichi as ti
 from taichi.math import vec2, vec4
 
 
-from .config import SAMPLES_PER_FRAME, ADAPTIVE_SAMPLING
+from .config import SAMPLES_PER_FRAME, ADAPTIVE_SAMPLING, TILE_BINNING, WARM_START, WAVEFRONT
 from .camera import smooth
-from .pathtracer import pathtrace
+from .pathtracer import pathtrace, bin_objects, move_warm
+from . import wavefront
 from .postprocessor import post_process
 from .fileds import image_buffer, ray_buffer, diff_pixels, diff_buffer
+from .scene import forget_warm
 
 
 @ti.kernel
@@ -26,7 +28,18 @@ def render(refreshing):
     if refreshing or smooth.moving[None]:
         refresh()
 
+    if WARM_START:
+        if refreshing:
+            forget_warm()  # the lens or the field of view changed
+        move_warm()
+
+    if TILE_BINNING:
+        bin_objects()
+
     for _ in range(SAMPLES_PER_FRAME):
-        pathtrace()
+        if WAVEFRONT:
+            wavefront.pathtrace()
+        else:
+            pathtrace()
 
     post_process()
@@ -1,11 +1,29 @@
+import numpy as np
 import taichi as ti
-from taichi.math import vec3, radians
+from taichi.math import vec2, vec3, radians, length, sqrt, clamp, mix
 
 
-from .dataclass import SDFObject, Transform, Material, Ray
-from .config import MAX_RAYMARCH, MAX_DIS, PIXEL_RADIUS
-from .sdf import SHAPE, SHAPE_FUNC, calc_pos_scale, normal
+from .dataclass import SDFObject, Transform, Material, Ray, AABB
+from .config import (MAX_RAYMARCH, MAX_DIS, MIN_DIS, PIXEL_RADIUS, image_resolution,
+                     BVH_ACCELERATION, DISTANCE_CACHE, RAY_CULLING,
+                     TILE_BINNING, TILE_SIZE, TILE_CAPACITY, ANALYTIC_INTERSECTION,
+                     DYNAMIC_SCENE, SCENE_CAPACITY, MARCH_STATS, DOMAIN_REPETITION,
+                     DISTANCE_GRID, GRID_RESOLUTION, GRID_EXTENT, WARM_START,
+                     HIT_REFINEMENT, REFINE_STEPS, REFINE_BAND, RAY_CONES, CONE_MAX_SPREAD,
+                     LOD_PROXIES, SHAPE_GROUPS, LIGHT_SAMPLING)
+from .sdf import (SHAPE, SHAPE_FUNC, SHAPE_LIPSCHITZ, safe_distance, normal, bound,
+                  box_distance, ray_box, transform, repeat)
+from .intersect import SHAPE_INTERSECT
 from .util import rotate
+from .fileds import warm_buffer
+from .bvh import BVH
+from .tiles import Tiles
+from .grid import DistanceGrid
+from .groups import ShapeGroups
+from .lights import Lights
+from .neural import networks
+from .csg import tapes
+from .mesh import meshes
 
 
 OBJECTS = sorted([
@@ -32,23 +50,198 @@ OBJECTS = sorted([
               material=Material(vec3(1, 1, 1)*0.9, vec3(1), 0, 1, 0, 2.950))
 ], key=lambda o: o.type)
 
-SHAPES = list(set([o.type for o in OBJECTS]))
+# types of a dynamic scene are runtime data, so every shape is compiled in
+SHAPES = [shape for shape in SHAPE if shape != SHAPE.NONE] if DYNAMIC_SCENE \
+    else list(set([o.type for o in OBJECTS]))
 
+# shapes with a table of data behind them allocate it only when compiled in,
+# and a composite compiles in every primitive
+TABLES = {SHAPE.NEURAL: networks, SHAPE.CSG: tapes, SHAPE.MESH: meshes}
+for shape in (TABLES if SHAPE.CSG in SHAPES else SHAPES):
+    if shape in TABLES:
+        TABLES[shape].allocate()
+
+# with analytic intersection only the other shapes are sphere traced
+MARCHED_SHAPES = [shape for shape in SHAPES
+                  if not ANALYTIC_INTERSECTION or shape not in SHAPE_INTERSECT]
+# and so are repeated objects, which have no closed form either
+MARCHED = [i for i, o in enumerate(OBJECTS)
+           if o.type in MARCHED_SHAPES or any(o.transform.repeat)]
+ANALYTIC = [i for i in range(len(OBJECTS)) if i not in MARCHED]
+# shapes that may have marched objects, each gets its own loop
+GROUPED_SHAPES = SHAPES if DYNAMIC_SCENE else sorted(set(OBJECTS[i].type for i in MARCHED))
+
+
+CAPACITY = max(SCENE_CAPACITY, len(OBJECTS)) if DYNAMIC_SCENE else len(OBJECTS)
 
 objects = SDFObject.field()
-ti.root.dense(ti.i, len(OBJECTS)).place(objects)
-for i in range(objects.shape[0]):
+ti.root.dense(ti.i, CAPACITY).place(objects)
+for i in range(len(OBJECTS)):
     objects[i] = OBJECTS[i]
 
+object_count = ti.field(dtype=ti.i32, shape=())
+object_count[None] = len(OBJECTS)
+
+bvh = BVH(CAPACITY)
+tiles = Tiles(image_resolution, TILE_SIZE,
+              min(TILE_CAPACITY, CAPACITY), CAPACITY)
+grid = DistanceGrid(GRID_RESOLUTION if DISTANCE_GRID else 1)
+groups = ShapeGroups(CAPACITY, len(SHAPE))
+lights = Lights(CAPACITY)
+
+# culled objects are excluded by an infinite distance bound,
+# which needs static indices, so a dynamic scene goes without
+CACHED_NEAREST = not DYNAMIC_SCENE and (
+    DISTANCE_CACHE or (RAY_CULLING and not BVH_ACCELERATION))
+distance_bounds = ti.types.vector(len(OBJECTS) if CACHED_NEAREST else 1, float)
+
+# rays that ran out of steps before a hit or escape
+exhausted_rays = ti.field(dtype=ti.i32, shape=())
+
+# a free ball proves the tube around the ray empty only if every object
+# counts, not just those this one ray may hit
+WARM_PROOF = WARM_START and not (RAY_CULLING or TILE_BINNING or ANALYTIC_INTERSECTION)
+
+# a proxy is a branch per object, which the grouped loops go without,
+# and cached bounds need a static index per object, which they lack,
+# so those take precedence and the march would never see the groups
+GROUPED = SHAPE_GROUPS and not LOD_PROXIES and not CACHED_NEAREST
+
 
 @ti.func
-def nearest(p: vec3) -> tuple[int, float]:
+def signed_distance(obj: SDFObject, p: vec3) -> float:
+    dis = MAX_DIS
+    for shape in ti.static(SHAPES):
+        if obj.type == shape:
+            dis = safe_distance(shape, obj, p)
+
+    return dis
+
+
+@ti.func
+def is_marched(obj: SDFObject) -> bool:
+    marched = (obj.transform.repeat != 0).any()
+    for shape in ti.static(MARCHED_SHAPES):
+        if obj.type == shape:
+            marched = True
+
+    return marched
+
+
+@ti.func
+def marched_distance(obj: SDFObject, p: vec3) -> float:
+    dis = MAX_DIS
+    if is_marched(obj):
+        dis = signed_distance(obj, p)
+
+    return dis
+
+
+@ti.func
+def proxy(i: int, p: vec3, footprint: float) -> tuple[bool, float]:
+    # the bounding sphere stands in for an object that declares a lod
+    # once p is that many radii away, where it is a cheap lower bound,
+    # but never within the footprint, so it only skips and never hits
+    stand_in, dis = False, 0.0
+    if ti.static(LOD_PROXIES):
+        if objects[i].lod > 0:
+            box = bvh.boxes[i]
+            radius = 0.5 * length(box.upper - box.lower)
+            dis = length(p - 0.5 * (box.lower + box.upper)) - radius
+            stand_in = dis > objects[i].lod * radius and dis > footprint
+
+    return stand_in, dis
+
+
+@ti.func
+def object_distance(i: int, p: vec3, footprint: float) -> float:
+    stand_in, dis = proxy(i, p, footprint)
+    if not stand_in:
+        dis = marched_distance(objects[i], p)
+
+    return abs(dis)
+
+
+@ti.func
+def static_distance(i: ti.template(), p: vec3, footprint: float) -> float:
+    stand_in, dis = proxy(i, p, footprint)
+    if not stand_in:
+        dis = safe_distance(ti.static(OBJECTS[i].type), objects[i], p)
+
+    return abs(dis)
+
+
+@ti.func
+def nearest_bvh(p: vec3, footprint: float) -> tuple[int, float]:
     index, min_dis = 0, MAX_DIS
 
-    for i in ti.static(range(len(OBJECTS))):
-        shape = ti.static(OBJECTS[i].type)
-        pos, scale = calc_pos_scale(objects[i], p)
-        dis = abs(SHAPE_FUNC[shape](pos, scale))
+    node = 0
+    while node < bvh.size[None]:
+        n = bvh.nodes[node]
+
+        # the box is a lower bound of every distance inside the subtree
+        if box_distance(n.box, p) < min_dis:
+            if n.object >= 0:
+                dis = object_distance(n.object, p, footprint)
+                if dis < min_dis:
+                    index, min_dis = n.object, dis
+            node += 1
+        else:
+            node = n.skip
+
+    return index, min_dis
+
+
+@ti.func
+def nearest_grouped(p: vec3) -> tuple[int, float]:
+    index, min_dis = 0, MAX_DIS
+
+    # one loop per shape over its slots, without a branch on the type
+    for shape in ti.static(GROUPED_SHAPES):
+        for k in range(groups.start[shape], groups.start[shape + 1]):
+            pos = groups.matrix[k] @ (p - groups.position[k])
+            if ti.static(DOMAIN_REPETITION):
+                pos = repeat(pos, groups.repeat[k], groups.copies[k])
+            scale = groups.scale[k]
+            dis = abs(SHAPE_FUNC[shape](pos, scale) / SHAPE_LIPSCHITZ[shape](scale))
+
+            index = ti.select(dis < min_dis, k, index)
+            min_dis = min(dis, min_dis)
+
+    return groups.index[index], min_dis
+
+
+@ti.func
+def nearest(p: vec3, footprint: float = 0.0) -> tuple[int, float]:
+    index, min_dis = 0, MAX_DIS
+
+    if ti.static(BVH_ACCELERATION):
+        index, min_dis = nearest_bvh(p, footprint)
+    elif ti.static(GROUPED):
+        index, min_dis = nearest_grouped(p)
+    elif ti.static(DYNAMIC_SCENE):
+        for i in range(object_count[None]):
+            dis = object_distance(i, p, footprint)
+
+            if dis < min_dis:
+                index, min_dis = i, dis
+    else:
+        for i in ti.static(MARCHED):
+            dis = static_distance(i, p, footprint)
+
+            if dis < min_dis:
+                index, min_dis = i, dis
+
+    return index, min_dis
+
+
+@ti.func
+def nearest_tile(p: vec3, tile: int, footprint: float) -> tuple[int, float]:
+    index, min_dis = 0, MAX_DIS
+
+    for k in range(tiles.count[tile]):
+        i = tiles.objects[tile, k]
+        dis = object_distance(i, p, footprint)
 
         if dis < min_dis:
             index, min_dis = i, dis
@@ -57,30 +250,297 @@ def nearest(p: vec3) -> tuple[int, float]:
 
 
 @ti.func
-def raycast(ray: Ray) -> tuple[Ray, SDFObject, bool]:
+def nearest_cached(p: vec3, bounds: ti.template(), last: int, footprint: float) -> tuple[int, float]:
+    index, min_dis = last, MAX_DIS
+
+    # the last nearest object usually gives the tightest start, so the
+    # first pass only takes it and the second the rest, through one
+    # unrolled body, and an object whose lower bound can not beat the
+    # minimum is skipped
+    for k in range(2):
+        for i in ti.static(MARCHED):
+            if (i == last) == (k == 0) and bounds[i] < min_dis:
+                dis = static_distance(i, p, footprint)
+                bounds[i] = dis
+
+                if dis < min_dis:
+                    index, min_dis = i, dis
+
+    return index, min_dis
+
+
+@ti.func
+def hit_box(box: AABB, ray: Ray) -> vec2:
+    # pad by the hit tolerance at the farthest point of the box
+    reach = length(0.5 * (box.upper + box.lower) - ray.origin)
+    reach += length(0.5 * (box.upper - box.lower))
+    pad = MIN_DIS + reach * PIXEL_RADIUS
+    return ray_box(box, ray.origin, ray.direction, pad)
+
+
+@ti.func
+def cull(ray: Ray, bounds: ti.template()) -> vec2:
+    interval = vec2(MAX_DIS, 0)
+
+    if ti.static(BVH_ACCELERATION):
+        interval = hit_box(bvh.nodes[0].box, ray)
+    elif ti.static(DYNAMIC_SCENE):
+        for i in range(object_count[None]):
+            if is_marched(objects[i]):
+                span = hit_box(bvh.boxes[i], ray)
+
+                if span.x <= span.y:
+                    interval.x = min(interval.x, span.x)
+                    interval.y = max(interval.y, span.y)
+    else:
+        for i in ti.static(MARCHED):
+            span = hit_box(bvh.boxes[i], ray)
+
+            if span.x <= span.y:
+                interval.x = min(interval.x, span.x)
+                interval.y = max(interval.y, span.y)
+            else:
+                bounds[i] = 1e32
+
+    return interval
+
+
+@ti.func
+def nearest_ray(p: vec3, bounds: ti.template(), last: int, footprint: float) -> tuple[int, float]:
+    index, min_dis = last, MAX_DIS
+
+    if ti.static(CACHED_NEAREST):
+        index, min_dis = nearest_cached(p, bounds, last, footprint)
+    else:
+        index, min_dis = nearest(p, footprint)
+
+    return index, min_dis
+
+
+@ti.func
+def analytic_hit(shape: ti.template(), obj: SDFObject, ray: Ray) -> float:
+    tr = obj.transform
+    ro = transform(tr, ray.origin)
+    rd = tr.matrix @ ray.direction
+    return SHAPE_INTERSECT[shape](ro, rd, tr.scale)
+
+
+@ti.func
+def intersect(ray: Ray) -> tuple[int, float]:
+    index, t_min = -1, MAX_DIS
+
+    if ti.static(DYNAMIC_SCENE):
+        for i in range(object_count[None]):
+            t = MAX_DIS
+            if not is_marched(objects[i]):
+                for shape in ti.static(SHAPES):
+                    if ti.static(shape not in MARCHED_SHAPES):
+                        if objects[i].type == shape:
+                            t = analytic_hit(shape, objects[i], ray)
+
+            if t < t_min:
+                index, t_min = i, t
+    else:
+        for i in ti.static(ANALYTIC):
+            t = analytic_hit(ti.static(OBJECTS[i].type), objects[i], ray)
+
+            if t < t_min:
+                index, t_min = i, t
+
+    return index, t_min
+
+
+@ti.func
+def refine(obj: SDFObject, ray: Ray, a: float, fa: float, b: float, fb: float) -> tuple[float, float]:
+    # regula falsi with the Illinois rule, which keeps a stale end from
+    # stalling the bracket
+    c, fc, side = a, fa, 0
+    for _ in range(REFINE_STEPS):
+        c = (a * fb - b * fa) / (fb - fa)
+        fc = signed_distance(obj, ray.origin + ray.direction * c)
+
+        if fc * fa > 0:
+            a, fa = c, fc
+            if side == -1:
+                fb *= 0.5
+            side = -1
+        else:
+            b, fb = c, fc
+            if side == 1:
+                fa *= 0.5
+            side = 1
+
+    return c, fc
+
+
+@ti.func
+def march(ray: Ray, tile: int, start: float, cone: vec2) -> tuple[Ray, int, bool, float]:
     t, w, s, distance = 0.0, 1.6, 0.0, MAX_DIS
     index, hit = 0, False
 
-    for _ in range(MAX_RAYMARCH):
+    # lower bounds of each object's distance, valid along the whole ray
+    # since a step of s shrinks any distance by at most |s|
+    bounds = distance_bounds(0)
+    t_max, steps = MAX_DIS, MAX_RAYMARCH
+
+    # a wide cone needs no fine hit, which also ends it in fewer steps,
+    # but it keeps the full budget, since a ray that runs out of steps
+    # picks up the sky, see Akenine-Möller et al., Texture Level of Detail
+    # Strategies for Real-Time Ray Tracing, 2019
+    tolerance = PIXEL_RADIUS
+    if ti.static(RAY_CONES):
+        tolerance = clamp(ray.spread, PIXEL_RADIUS, CONE_MAX_SPREAD * PIXEL_RADIUS)
+
+    # march only until the nearest closed-form hit
+    origin, analytic, t_hit = ray.origin, -1, MAX_DIS
+    if ti.static(ANALYTIC_INTERSECTION):
+        analytic, t_hit = intersect(ray)
+        t_max = t_hit
+
+        if ti.static(not DYNAMIC_SCENE and len(MARCHED) == 0):
+            steps = 0  # every object has a closed-form hit
+
+    if ti.static(RAY_CULLING):
+        interval = cull(ray, bounds)
+        t_max = min(interval.y, t_max)
+        if interval.x <= interval.y:
+            t = interval.x
+            ray.origin += ray.direction * t
+        else:
+            steps = 0  # nothing to hit, the ray escapes at once
+
+    # the tube of radius cone.x + cone.y * t around the ray is empty up to
+    # safe, so the rays of the next frame through this pixel may start there
+    safe, proving = t, cone.y > 0
+    if ti.static(WARM_PROOF):
+        if start > t and steps > 0:
+            _, free = nearest(ray.origin + ray.direction * (start - t))
+            if free >= cone.x + cone.y * start:  # nothing moved into the tube
+                ray.origin += ray.direction * (start - t)
+                t = safe = start
+
+    exhausted = steps > 0
+    for _ in range(steps):
         ld = distance
-        index, distance = nearest(ray.origin)
+        far = 0.0
+
+        # the hit test runs after a step of at most twice the distance, so
+        # a proxy has to clear the tolerance out there to never be a hit
+        footprint = t * tolerance / (1.0 - 2.0 * tolerance)
+        if ti.static(DISTANCE_GRID):
+            far = grid.lookup(ray.origin)
+
+        if far > 0:  # a safe step through empty space
+            distance = far
+        elif ti.static(TILE_BINNING):
+            if tile >= 0:  # a primary ray only meets its tile's objects
+                index, distance = nearest_tile(ray.origin, tile, footprint)
+            else:
+                index, distance = nearest_ray(ray.origin, bounds, index, footprint)
+        else:
+            index, distance = nearest_ray(ray.origin, bounds, index, footprint)
+
+        if ti.static(WARM_PROOF):
+            # the free ball covers the tube within reach of this point,
+            # which extends the proof while the covered parts overlap
+            if proving:
+                rho = cone.x + cone.y * t
+                reach = sqrt(max(distance * distance - rho * rho, 0.0))
+                proving = distance > rho and t - reach <= safe
+                if proving:
+                    safe = max(safe, t + reach)
+
+        if ti.static(HIT_REFINEMENT):
+            # converge on a bracketed crossing of the nearest object instead
+            # of creeping towards it, which is slowest at grazing angles
+            a, b = 0.0, 0.0
+            if far > 0:
+                pass
+            elif w > 1.0 and ld + distance < s:
+                a = -s  # the over-relaxed step may have crossed it
+            elif distance < REFINE_BAND * t * tolerance and 0 < ld - distance < 0.5 * s:
+                b = distance * s / (ld - distance)  # where a grazing slope meets it
+
+            if a < b:
+                obj = objects[index]
+                fa = signed_distance(obj, ray.origin + ray.direction * a)
+                fb = signed_distance(obj, ray.origin + ray.direction * b)
+                if fa * fb < 0:
+                    c, fc = refine(obj, ray, a, fa, b, fb)
+                    if abs(fc) < (t + c) * tolerance:  # else keep marching
+                        t += c
+                        ray.origin += ray.direction * c
+                        hit, exhausted = True, False
+                        break
 
         if w > 1.0 and ld + distance < s:
             s -= w * s
             w = 1.0
             t += s
             ray.origin += ray.direction * s
+            bounds -= abs(s)
             continue
 
+        # relax by the slope of the distance along the ray, so that the
+        # next sphere just reaches back to this one, see Bán and Valasek,
+        # Automatic Step Size Relaxation in Sphere Tracing, 2023
+        if s > 0:
+            m = clamp((distance - ld) / s, -1.0, 0.0)
+            w = mix(2.0 / (1.0 - m), w, 0.7)
+
         s = w * distance
         t += s
         ray.origin += ray.direction * s
+        bounds -= s
 
-        hit = distance < t * PIXEL_RADIUS
-        if hit or t >= MAX_DIS:
+        # an over-relaxed step may still be taken back,
+        # so leave the interval only by the safe distance, and a grid
+        # step leaves index stale, so it can never be a hit
+        hit = far <= 0 and distance < t * tolerance
+        if hit or t - s + distance >= t_max:
+            exhausted = False
             break
 
+    if ti.static(MARCH_STATS):
+        if exhausted:
+            exhausted_rays[None] += 1
+
+    if ti.static(ANALYTIC_INTERSECTION):
+        if analytic >= 0 and (not hit or t > t_hit):
+            index, hit = analytic, True
+            ray.origin = origin + ray.direction * t_hit
+
     ray.depth += 1
+    return ray, index, hit, safe
+
+
+@ti.func
+def occluded(origin: vec3, direction: vec3, distance: float, light: int) -> bool:
+    # an any-hit march towards a point on a light, or the sky for no light,
+    # which gives up at the first surface it reaches that is not the light
+    clear, t = True, 0.0
+
+    if ti.static(ANALYTIC_INTERSECTION):
+        index, t_hit = intersect(Ray(origin, direction))
+        clear = index == light or t_hit >= distance
+
+    steps = MAX_RAYMARCH if clear else 0
+    for _ in range(steps):
+        index, dis = nearest(origin + direction * t, t * PIXEL_RADIUS)
+        if dis < t * PIXEL_RADIUS:
+            clear = index == light
+            break
+
+        t += dis
+        if t >= distance:
+            break
+
+    return not clear
+
+
+@ti.func
+def raycast(ray: Ray, tile: int = -1) -> tuple[Ray, SDFObject, bool]:
+    ray, index, hit, _ = march(ray, tile, 0.0, vec2(0))
     return ray, objects[index], hit
 
 
@@ -96,6 +556,16 @@ def calc_normal(obj: SDFObject, p: vec3) -> vec3:
     return n
 
 
+@ti.func
+def calc_bound(obj: SDFObject) -> AABB:
+    box = AABB()
+    for shape in ti.static(SHAPES):
+        if obj.type == shape:
+            box = bound(shape, obj)
+
+    return box
+
+
 @ti.func
 def update_transform(i: int):
     transform = objects[i].transform
@@ -109,5 +579,114 @@ def update_all_transform():
         update_transform(i)
 
 
+@ti.kernel
+def update_all_bound():
+    for i in objects:
+        bvh.boxes[i] = calc_bound(objects[i])
+
+
+@ti.kernel
+def bake_distance_grid():
+    for I in ti.grouped(grid.values):
+        _, dis = nearest(grid.center(I))
+        grid.values[I] = max(dis - grid.radius(), 0)
+
+
+def place_distance_grid(indices: list[int]):
+    # the grid only needs to cover the marched objects,
+    # though one huge object must not make the cells huge
+    boxes = bvh.boxes.to_numpy()
+    lower = boxes['lower'][indices].min(0) if indices else np.zeros(3)
+    upper = boxes['upper'][indices].max(0) if indices else np.zeros(3)
+    grid.place(np.clip(lower, -GRID_EXTENT, GRID_EXTENT),
+               np.clip(upper, -GRID_EXTENT, GRID_EXTENT))
+
+
+def marched_indices() -> list[int]:
+    if not DYNAMIC_SCENE:
+        return MARCHED
+
+    count = object_count[None]
+    types = objects.type.to_numpy()[:count]
+    repeats = objects.transform.repeat.to_numpy()[:count]
+    return [i for i, (t, r) in enumerate(zip(types, repeats))
+            if t in MARCHED_SHAPES or r.any()]
+
+
 def build_scene():
+    repeats = objects.transform.repeat.to_numpy()[:object_count[None]]
+    if not DOMAIN_REPETITION and repeats.any():
+        raise ValueError('repeated objects need DOMAIN_REPETITION')
+
     update_all_transform()
+    update_all_bound()
+
+    indices = marched_indices()
+    if BVH_ACCELERATION:
+        bvh.build(indices)
+
+    if GROUPED:
+        groups.build(objects.type.to_numpy(), indices)
+        groups.gather(objects)
+
+    if LIGHT_SAMPLING:
+        lights.build(objects, object_count[None])
+
+    if DISTANCE_GRID:
+        place_distance_grid(indices)
+        bake_distance_grid()
+
+
+@ti.kernel
+def forget_warm():
+    # an edit may put an object anywhere in the segments proved empty
+    for i, j in warm_buffer:
+        warm_buffer[i, j] = 0.0
+
+
+# editing a dynamic scene only changes data, the kernels stay compiled
+
+
+def load_scene(scene: list):
+    assert DYNAMIC_SCENE, 'only a dynamic scene can be edited'
+    if len(scene) > CAPACITY:
+        raise ValueError(f'{len(scene)} objects exceed the capacity of {CAPACITY}')
+
+    for i, obj in enumerate(scene):
+        objects[i] = obj
+    for i in range(len(scene), CAPACITY):
+        objects[i] = SDFObject()  # leftovers are empty shapes
+
+    object_count[None] = len(scene)
+    build_scene()
+    if WARM_START:
+        forget_warm()
+
+
+def add_object(obj: SDFObject) -> int:
+    assert DYNAMIC_SCENE, 'only a dynamic scene can be edited'
+    index = object_count[None]
+    if index >= CAPACITY:
+        raise ValueError(f'the scene is full at {CAPACITY} objects')
+
+    objects[index] = obj
+    object_count[None] = index + 1
+    build_scene()
+    if WARM_START:
+        forget_warm()
+    return index
+
+
+def remove_object(index: int):
+    assert DYNAMIC_SCENE, 'only a dynamic scene can be edited'
+    last = object_count[None] - 1
+    if not 0 <= index <= last:
+        raise IndexError(f'no object at {index}')
+
+    # the last object moves into the hole to keep the table dense
+    objects[index] = objects[last]
+    objects[last] = SDFObject()
+    object_count[None] = last
+    build_scene()
+    if WARM_START:
+        forget_warm()
@@ -1,13 +1,19 @@
 import taichi as ti
-from taichi.math import length, vec2, vec3, min, max, dot, normalize
+from taichi.math import length, vec2, vec3, min, max, dot, normalize, round, clamp
 from enum import IntEnum
 
-from .dataclass import Transform, SDFObject
-from .config import MAX_DIS
+from .dataclass import Transform, SDFObject, AABB, Dual
+from .config import MAX_DIS, ANALYTIC_NORMAL, DOMAIN_REPETITION
+from .dual import dvar, dadd, dscale, doffset, dmax, dlength
+from .neural import networks
+from .mesh import meshes
+from . import csg  # composites are made of the shapes below
 
 
 # from https://iquilezles.org/articles/distfunctions/
 
+BOX_ROUNDING = 0.03
+
 
 class SHAPE(IntEnum):
     NONE = 0
@@ -16,6 +22,9 @@ class SHAPE(IntEnum):
     CYLINDER = 3
     CONE = 4
     PLANE = 5
+    NEURAL = 6
+    CSG = 7  # see csg.py
+    MESH = 8
 
 
 @ti.func
@@ -31,7 +40,7 @@ def sd_sphere(p: vec3, r: vec3) -> float:
 @ti.func
 def sd_box(p: vec3, b: vec3) -> float:
     q = abs(p) - b
-    return length(max(q, 0)) + min(q.max(), 0) - 0.03
+    return length(max(q, 0)) + min(q.max(), 0) - BOX_ROUNDING
 
 
 @ti.func
@@ -51,6 +60,24 @@ def sd_plane(p: vec3, h: vec3) -> float:
     return p.y - h.y
 
 
+@ti.func
+def sd_neural(p: vec3, rn: vec3) -> float:
+    # rn is (radius, index of the network)
+    return networks.evaluate(int(rn.y), p / rn.x) * rn.x
+
+
+@ti.func
+def sd_mesh(p: vec3, rm: vec3) -> float:
+    # rm is (half size, index of the baked mesh)
+    return meshes.sample(int(rm.y), p / rm.x) * rm.x
+
+
+@ti.func
+def sd_csg(p: vec3, c: vec3) -> float:
+    # c.x is the index of the tape
+    return csg.tapes.evaluate(int(c.x), p)
+
+
 SHAPE_FUNC = {
     SHAPE.NONE: sd_none,
     SHAPE.SPHERE: sd_sphere,
@@ -58,13 +85,199 @@ SHAPE_FUNC = {
     SHAPE.CYLINDER: sd_cylinder,
     SHAPE.CONE: sd_cone,
     SHAPE.PLANE: sd_plane,
+    SHAPE.NEURAL: sd_neural,
+    SHAPE.CSG: sd_csg,
+    SHAPE.MESH: sd_mesh,
 }
 
 
+# Lipschitz bounds of the functions above, a distance divided by its bound
+# changes by at most the step length, which keeps relaxed steps safe
+
+
+@ti.func
+def lp_exact(_: vec3) -> float:
+    return 1.0
+
+
+@ti.func
+def lp_cone(rh: vec3) -> float:
+    return max(length(rh.xz), 1.0)  # 1 when rh.xz is (sin, cos)
+
+
+@ti.func
+def lp_neural(rn: vec3) -> float:
+    return networks.lipschitz[int(rn.y)]
+
+
+SHAPE_LIPSCHITZ = {
+    SHAPE.NONE: lp_exact,
+    SHAPE.SPHERE: lp_exact,
+    SHAPE.BOX: lp_exact,
+    SHAPE.CYLINDER: lp_exact,
+    SHAPE.CONE: lp_cone,
+    SHAPE.PLANE: lp_exact,
+    SHAPE.NEURAL: lp_neural,
+    SHAPE.CSG: lp_exact,  # primitives divide by their own
+    SHAPE.MESH: lp_exact,
+}
+
+
+# exact gradients of the distance functions above
+
+
+@ti.func
+def nm_sphere(p: vec3, _: vec3) -> vec3:
+    return p
+
+
+@ti.func
+def nm_box(p: vec3, b: vec3) -> vec3:
+    q = abs(p) - b
+    n = max(q, 0)
+    if q.max() <= 0:  # inside the core only the nearest face counts
+        n = vec3(q.x >= q.max(), q.y >= q.max(), q.z >= q.max())
+    return n * ti.select(p < 0, -1.0, 1.0)
+
+
+@ti.func
+def nm_cylinder(p: vec3, rh: vec3) -> vec3:
+    d = abs(vec2(length(p.xz), p.y)) - rh.xy
+    n = max(d, 0)
+    if d.max() <= 0:
+        n = vec2(d.x >= d.y, d.y > d.x)
+
+    radial = p.xz / max(length(p.xz), 1e-12)
+    return vec3(radial.x * n.x, n.y * ti.select(p.y < 0, -1.0, 1.0), radial.y * n.x)
+
+
+@ti.func
+def nm_plane(_: vec3, __: vec3) -> vec3:
+    return vec3(0, 1, 0)
+
+
+SHAPE_NORMAL = {
+    SHAPE.SPHERE: nm_sphere,
+    SHAPE.BOX: nm_box,
+    SHAPE.CYLINDER: nm_cylinder,
+    SHAPE.PLANE: nm_plane,
+}
+
+
+# distances with gradients for shapes without a closed-form normal
+
+
+@ti.func
+def gd_cone(p: vec3, rh: vec3) -> Dual:
+    x, y, z = dvar(p)
+    q = dlength(x, z)
+    side = dadd(dscale(q, rh.x), dscale(y, rh.z))
+    return dmax(side, dscale(doffset(y, rh.y), -1.0))
+
+
+@ti.func
+def gd_neural(p: vec3, rn: vec3) -> Dual:
+    d = networks.gradient(int(rn.y), p / rn.x)
+    return Dual(d.value * rn.x, d.grad)
+
+
+@ti.func
+def gd_mesh(p: vec3, rm: vec3) -> Dual:
+    d = meshes.gradient(int(rm.y), p / rm.x)
+    return Dual(d.value * rm.x, d.grad)
+
+
+@ti.func
+def gd_csg(p: vec3, c: vec3) -> Dual:
+    return csg.tapes.gradient(int(c.x), p)
+
+
+SHAPE_GRAD = {
+    SHAPE.CONE: gd_cone,
+    SHAPE.NEURAL: gd_neural,
+    SHAPE.CSG: gd_csg,
+    SHAPE.MESH: gd_mesh,
+}
+
+
+# local bounds of each shape as (center, half extent)
+
+
+@ti.func
+def bd_none(_: vec3) -> tuple[vec3, vec3]:
+    return vec3(0), vec3(0)
+
+
+@ti.func
+def bd_sphere(r: vec3) -> tuple[vec3, vec3]:
+    return vec3(0), vec3(r.x)
+
+
+@ti.func
+def bd_box(b: vec3) -> tuple[vec3, vec3]:
+    return vec3(0), b + BOX_ROUNDING
+
+
+@ti.func
+def bd_cylinder(rh: vec3) -> tuple[vec3, vec3]:
+    return vec3(0), rh.xyx
+
+
+@ti.func
+def bd_cone(rh: vec3) -> tuple[vec3, vec3]:
+    r = rh.y * rh.z / max(rh.x, 1e-6)
+    return vec3(0, -0.5 * rh.y, 0), vec3(r, 0.5 * rh.y, r)
+
+
+@ti.func
+def bd_plane(h: vec3) -> tuple[vec3, vec3]:
+    return vec3(0, h.y, 0), vec3(MAX_DIS, 0, MAX_DIS)
+
+
+@ti.func
+def bd_neural(rn: vec3) -> tuple[vec3, vec3]:
+    return vec3(0), vec3(rn.x)
+
+
+@ti.func
+def bd_mesh(rm: vec3) -> tuple[vec3, vec3]:
+    return vec3(0), vec3(rm.x)
+
+
+@ti.func
+def bd_csg(c: vec3) -> tuple[vec3, vec3]:
+    return csg.tapes.bound(int(c.x))
+
+
+SHAPE_BOUND = {
+    SHAPE.NONE: bd_none,
+    SHAPE.SPHERE: bd_sphere,
+    SHAPE.BOX: bd_box,
+    SHAPE.CYLINDER: bd_cylinder,
+    SHAPE.CONE: bd_cone,
+    SHAPE.PLANE: bd_plane,
+    SHAPE.NEURAL: bd_neural,
+    SHAPE.CSG: bd_csg,
+    SHAPE.MESH: bd_mesh,
+}
+
+
+@ti.func
+def repeat(p: vec3, spacing: vec3, copies: vec3) -> vec3:
+    # fold space into the nearest cell, so every copy costs one evaluation
+    # from https://iquilezles.org/articles/sdfrepetition/
+    cell = round(p / max(spacing, 1e-12))
+    cell = ti.select(copies > 0, clamp(cell, -copies, copies), cell)
+    return p - ti.select(spacing > 0, spacing * cell, 0.0)
+
+
 @ti.func
 def transform(t: Transform, p: vec3) -> vec3:
     p -= t.position  # Cannot squeeze the Euclidean space of distance field
     p = t.matrix @ p  # Otherwise the correct ray marching is not possible
+    if ti.static(DOMAIN_REPETITION):
+        if (t.repeat != 0).any():
+            p = repeat(p, t.repeat, t.copies)
     return p
 
 
@@ -74,14 +287,57 @@ def calc_pos_scale(obj: SDFObject, p: vec3) -> tuple[vec3, vec3]:
     return pos, obj.transform.scale
 
 
+@ti.func
+def safe_distance(shape: ti.template(), obj: SDFObject, p: vec3) -> float:
+    pos, scale = calc_pos_scale(obj, p)
+    return SHAPE_FUNC[shape](pos, scale) / SHAPE_LIPSCHITZ[shape](scale)
+
+
 @ti.func
 def normal(shape: ti.template(), obj: SDFObject, p: vec3) -> vec3:
     pos, scale = calc_pos_scale(obj, p)
     n, h = vec3(0), 0.5773 * 0.005
 
-    # from https://iquilezles.org/articles/normalsSDF/
-    for i in ti.static(range(4)):
-        e = 2.0*vec3((((i+3) >> 1) & 1), ((i >> 1) & 1), (i & 1))-1.0
-        n += e*SHAPE_FUNC[shape](pos+e*h, scale)
+    if ti.static(ANALYTIC_NORMAL and shape in SHAPE_NORMAL):
+        n = SHAPE_NORMAL[shape](pos, scale)
+    elif ti.static(ANALYTIC_NORMAL and shape in SHAPE_GRAD):
+        n = SHAPE_GRAD[shape](pos, scale).grad
+    else:
+        # from https://iquilezles.org/articles/normalsSDF/
+        for i in ti.static(range(4)):
+            e = 2.0*vec3((((i+3) >> 1) & 1), ((i >> 1) & 1), (i & 1))-1.0
+            n += e*SHAPE_FUNC[shape](pos+e*h, scale)
+
+    # back from the local frame of the object
+    return normalize(obj.transform.matrix.transpose() @ n)
+
+
+@ti.func
+def bound(shape: ti.template(), obj: SDFObject) -> AABB:
+    center, extent = SHAPE_BOUND[shape](obj.transform.scale)
+    inverse = obj.transform.matrix.transpose()  # rotation only
+
+    spacing, copies = obj.transform.repeat, obj.transform.copies
+    reach = ti.select(copies > 0, spacing * copies, MAX_DIS)
+    extent += ti.select(spacing > 0, reach, 0.0)
+
+    center = obj.transform.position + inverse @ center
+    extent = abs(inverse) @ extent
+    return AABB(center - extent, center + extent)
+
+
+@ti.func
+def box_distance(box: AABB, p: vec3) -> float:
+    q = max(box.lower - p, p - box.upper)
+    return length(max(q, 0))
+
+
+@ti.func
+def ray_box(box: AABB, ro: vec3, rd: vec3, pad: float) -> vec2:
+    inv = 1.0 / ti.select(abs(rd) < 1e-8, 1e-8, rd)
+    t0 = (box.lower - pad - ro) * inv
+    t1 = (box.upper + pad - ro) * inv
 
-    return normalize(n)
+    near = min(t0, t1).max()
+    far = max(t0, t1).min()
+    return vec2(max(near, 0), far)  # empty if x > y
@@ -0,0 +1,52 @@
+import taichi as ti
+from taichi.math import vec2, vec4, length
+
+
+from .dataclass import Camera
+from .config import SCREEN_PIXEL_SIZE, PIXEL_RADIUS, MIN_DIS
+from .camera import project_sphere
+
+
+@ti.data_oriented
+class Tiles:
+    def __init__(self, resolution: tuple[int, int], size: int, capacity: int, objects: int):
+        self.size = size
+        self.shape = ((resolution[0] + size - 1) // size,
+                      (resolution[1] + size - 1) // size)
+        self.capacity = capacity
+
+        self.rects = vec4.field(shape=objects)  # uv bounds of each object
+        self.count = ti.field(dtype=ti.i32, shape=self.shape[0] * self.shape[1])
+        self.objects = ti.field(dtype=ti.i32, shape=(self.count.shape[0], capacity))
+
+    @ti.func
+    def locate(self, i: int, j: int) -> int:
+        tile = (i // self.size) * self.shape[1] + j // self.size
+        return tile if self.count[tile] <= self.capacity else -1
+
+    @ti.func
+    def bin(self, boxes: ti.template(), count: int, camera: Camera):
+        for k in range(count):
+            box = boxes[k]
+            center = 0.5 * (box.upper + box.lower)
+            radius = 0.5 * length(box.upper - box.lower)
+
+            # pad by the hit tolerance at the far side of the sphere
+            reach = length(center - camera.lookfrom) + radius
+            radius += MIN_DIS + reach * PIXEL_RADIUS
+            self.rects[k] = project_sphere(camera, center, radius)
+
+        for tile in self.count:
+            i, j = tile // self.shape[1], tile % self.shape[1]
+            lower = vec2(i, j) * self.size * SCREEN_PIXEL_SIZE
+            upper = vec2(i + 1, j + 1) * self.size * SCREEN_PIXEL_SIZE
+
+            n = 0
+            for k in range(count):
+                rect = self.rects[k]
+                if (rect.xy <= upper).all() and (rect.zw >= lower).all():
+                    if n < self.capacity:
+                        self.objects[tile, n] = k
+                    n += 1
+
+            self.count[tile] = n
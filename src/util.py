@@ -1,5 +1,5 @@
 import taichi as ti
-from taichi.math import vec2, vec3, sqrt, sin, cos, pi, dot, mat3, atan2, asin
+from taichi.math import vec2, vec3, sqrt, sin, cos, pi, dot, mat3, atan2, asin, clamp
 
 
 from .dataclass import Ray
@@ -44,12 +44,19 @@ def rotate(a: vec3) -> mat3:
 
 @ti.func
 def sample_spherical_map(v: vec3) -> vec2:
-    uv = vec2(atan2(v.z, v.x), asin(v.y))
+    uv = vec2(atan2(v.z, v.x), asin(clamp(v.y, -1, 1)))
     uv *= vec2(0.5 / pi, 1 / pi)
     uv += 0.5
     return uv
 
 
+@ti.func
+def spherical_map_direction(uv: vec2) -> vec3:
+    # the inverse of sample_spherical_map
+    phi, lat = (uv.x - 0.5) * 2.0 * pi, (uv.y - 0.5) * pi
+    return vec3(cos(lat) * cos(phi), sin(lat), cos(lat) * sin(phi))
+
+
 @ti.func
 def sample_float() -> float:
     return ti.random()
@@ -0,0 +1,149 @@
+import taichi as ti
+from taichi.math import vec2, vec3, length
+from enum import IntEnum
+
+
+from .config import (image_resolution, ADAPTIVE_SAMPLING, NOISE_THRESHOLD,
+                     SAMPLES_PER_PIXEL, WARM_START, WAVEFRONT,
+                     SHADER_REORDERING, REORDER_DIRECTIONS)
+from .fileds import ray_buffer, diff_pixels, warm_buffer
+from .pathtracer import roulette, finished, restart, primary_hints, shade, escape
+from .pbr import LOBE, dominant_lobe
+from .queues import Queue
+from .scene import march, objects
+from .sdf import SHAPE
+
+
+# the bounce of every pixel split into stages, each one a kernel over a
+# compacted queue of the paths it applies to, so lanes are not held by
+# paths that another stage owns
+#   survive     russian roulette over every pixel
+#   generate    finished paths are added to the image and get camera rays
+#   extend      live paths are marched, escaped ones pick up the sky
+#   scatter     hit paths are shaded and bounce off their surfaces
+# with SHADER_REORDERING, hits are sorted by shape and material before they
+# are shaded, so neighbouring lanes run the same code on the same data,
+# and with REORDER_DIRECTIONS bounced rays are sorted by octant before
+# they are marched, see Meister et al., On Ray Reordering Techniques for
+# Faster GPU Ray Tracing, 2020
+
+
+class PATH(IntEnum):
+    IDLE = 0  # killed, or skipped by adaptive sampling
+    NEW = 1  # finished, waiting for a camera ray
+    LIVE = 2  # waiting to be marched
+    HIT = 3  # waiting to be shaded
+
+
+PATHS = image_resolution[0] * image_resolution[1] if WAVEFRONT else 1
+
+OCTANTS = 8 if REORDER_DIRECTIONS else 1
+HIT_KEYS = len(SHAPE) * len(LOBE) * OCTANTS
+RAY_KEYS = 1 + OCTANTS  # camera rays keep their own key
+
+labels = ti.field(dtype=ti.i32, shape=PATHS)
+hits = ti.field(dtype=ti.i32, shape=PATHS)  # object each path hit
+travel = ti.field(dtype=ti.f32, shape=PATHS)  # and how far it went to hit it
+keys = ti.field(dtype=ti.i32, shape=PATHS)  # to reorder paths by
+queue = Queue(PATHS, keys=max(HIT_KEYS, RAY_KEYS) if SHADER_REORDERING else 1)
+
+
+@ti.func
+def pixel(path: int) -> tuple[int, int]:
+    return path // image_resolution[1], path % image_resolution[1]
+
+
+@ti.func
+def octant(d: vec3) -> int:
+    o = 0
+    if ti.static(REORDER_DIRECTIONS):
+        o = int(d.x > 0) | int(d.y > 0) << 1 | int(d.z > 0) << 2
+    return o
+
+
+@ti.kernel
+def survive():
+    for i, j in ray_buffer:
+        path = i * image_resolution[1] + j
+        labels[path] = PATH.IDLE
+
+        active = True
+        if ti.static(ADAPTIVE_SAMPLING):
+            active = diff_pixels[i, j] > NOISE_THRESHOLD
+
+        if active:
+            ray, survived = roulette(ray_buffer[i, j])
+            if survived:
+                labels[path] = PATH.NEW if finished(ray) else PATH.LIVE
+                keys[path] = 1 + octant(ray.direction)
+            ray_buffer[i, j] = ray
+
+
+@ti.kernel
+def generate():
+    for k in range(queue.size[None]):
+        path = queue.items[k]
+        i, j = pixel(path)
+        ray_buffer[i, j] = restart(ray_buffer[i, j], i, j)
+        labels[path] = PATH.LIVE
+        keys[path] = 0
+
+
+@ti.kernel
+def extend():
+    for k in range(queue.size[None]):
+        path = queue.items[k]
+        i, j = pixel(path)
+        ray = ray_buffer[i, j]
+
+        tile, start, cone = -1, 0.0, vec2(0)
+        primary = ray.depth == 0  # a fresh camera ray
+        if primary:
+            tile, start, cone = primary_hints(i, j)
+
+        origin = ray.origin
+        ray, index, hit, safe = march(ray, tile, start, cone)
+
+        if ti.static(WARM_START):
+            if primary:
+                warm_buffer[i, j] = safe
+
+        labels[path] = PATH.IDLE
+        if hit:
+            hits[path] = index
+            travel[path] = length(ray.origin - origin)
+            labels[path] = PATH.HIT
+
+            obj = objects[index]
+            lobe = dominant_lobe(obj.material)
+            keys[path] = (obj.type * len(LOBE) + lobe) * OCTANTS + octant(ray.direction)
+        else:
+            ray = escape(ray)
+
+        ray_buffer[i, j] = ray
+
+
+@ti.kernel
+def scatter():
+    for k in range(queue.size[None]):
+        path = queue.items[k]
+        i, j = pixel(path)
+        ray_buffer[i, j] = shade(ray_buffer[i, j], hits[path], travel[path])
+
+
+def pathtrace():
+    for _ in range(SAMPLES_PER_PIXEL):
+        survive()
+
+        queue.select(labels, PATH.NEW)
+        generate()
+
+        queue.select(labels, PATH.LIVE)
+        if SHADER_REORDERING and REORDER_DIRECTIONS:
+            queue.sort(keys)
+        extend()
+
+        queue.select(labels, PATH.HIT)
+        if SHADER_REORDERING:
+            queue.sort(keys)
+        scatter()